@@ -1,6 +1,7 @@
 from typing import List, Dict
 import numpy as np
 import json
+import multiprocessing as mp
 import os
 import logging
 
@@ -92,4 +93,9 @@ def print_json(data: Dict[str, object]) -> None:
     json_data = json.dumps(data, sort_keys=True, indent=2)
     print(json_data)
 
-    
\ No newline at end of file
+    
+
+# Multiprocessing context of the worker pools: fork where available (the workers inherit the
+# imported modules and the data of the parent), spawn elsewhere
+def get_pool_context() -> mp.context.BaseContext:
+    return mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else 'spawn')
@@ -0,0 +1,324 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from auxiliary_functions import print_json, read_file
+from individual import Individual
+from generation import Generation
+from sequence import Sequence
+from chrom_pair import ChromPair
+from chrom_break_pos import get_chrom_break_pos
+from recombination import draw_generation_break_pos
+from genealogical_ancestors import get_genealogical_ancestors
+from genealogical_descendants import get_genealogical_descendants
+from pedigree_store import ReversedPedigree
+import instrumentation
+
+# Benchmarks of the hot paths on seeded synthetic inputs, over grids of population size, number of
+# generations, segment count and kappa, of the forward.py stages end to end and of the import time of
+# the entry points (each in a fresh interpreter). Every benchmark gives one row per grid point and the
+# empirical scaling exponents (slope of log time against log size). Results can be saved with
+# --out_file and compared with those of another commit (--compare).
+#
+# Examples:
+#   python benchmark.py --out_file bench_before.json
+#   python benchmark.py --out_file bench_after.json --compare bench_before.json
+#   python benchmark.py --benchmarks sequence genealogical -p 1000 4000 16000 -g 20 40
+
+
+# Best wall-clock time of `repeats` calls of fn
+def time_call(fn: Callable[[], object], repeats: int) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+# A synthetic previous generation: uniform locations, random parents and a fraction of paired males
+def make_generation(pop_size: int, paired_fraction: float, seed: int) -> List[Individual]:
+    rng = np.random.default_rng(seed)
+    gen = []
+    for j in range(pop_size):
+        ind = Individual()
+        ind.location = rng.uniform(0, 2 * np.pi)
+        ind.mom_id = int(rng.integers(0, pop_size // 2))
+        ind.dad_id = int(rng.integers(pop_size // 2, pop_size))
+        gen.append(ind)
+    for j in range(pop_size // 2, pop_size):
+        if rng.random() < paired_fraction:
+            gen[j].pair_id = 0
+    return gen
+
+
+def bench_find_single_male_partner(pop_sizes: List[int], kappa_parameter: float, num_moms: int, repeats: int, seed: int) -> List[Dict[str, float]]:
+    results = []
+    for pop_size in pop_sizes:
+        gen = make_generation(pop_size, 0.5, seed)
+        moms = [gen[j] for j in range(min(num_moms, pop_size // 2))]
+
+        def run_old():
+            for mom in moms:
+                mom.old3_find_single_male_partner(None, pop_size, gen, None, kappa_parameter, '')
+
+        def run_new():
+            for mom in moms:
+                mom.find_single_male_partner(None, pop_size, gen, None, kappa_parameter, '')
+
+        np.random.seed(seed)
+        random.seed(seed)
+        old_time = time_call(run_old, repeats) / len(moms)
+        new_time = time_call(run_new, repeats) / len(moms)
+        results.append({
+            'pop_size': pop_size,
+            'old_seconds_per_mom': old_time,
+            'new_seconds_per_mom': new_time,
+            'old_moms_per_second': 1.0 / old_time,
+            'new_moms_per_second': 1.0 / new_time,
+            'speedup': old_time / new_time,
+        })
+    return results
+
+
+def fit_exponent(sizes: List[float], seconds: List[float]) -> Optional[float]:
+    # Slope of log(seconds) against log(size): time grows as size ** exponent (None with fewer than two sizes)
+    points = [(size, t) for size, t in zip(sizes, seconds) if size > 0 and t > 0]
+    if len(set(size for size, _ in points)) < 2:
+        return None
+    return float(np.polyfit(np.log([size for size, _ in points]), np.log([t for _, t in points]), 1)[0])
+
+
+def fit_exponents(rows: List[dict], size_key: str, time_keys: List[str], group_keys: List[str] = ()) -> List[dict]:
+    # Scaling exponent of every time column against size_key, for every value of the other grid keys
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row[key] for key in group_keys), []).append(row)
+    exponents = []
+    for group, group_rows in groups.items():
+        exponent = dict(zip(group_keys, group), size=size_key)
+        for key in time_keys:
+            exponent[key] = fit_exponent([row[size_key] for row in group_rows], [row[key] for row in group_rows])
+        exponents.append(exponent)
+    return exponents
+
+
+def make_sequence(num_segments: int, seq_len: int, num_ids: int, rng: np.random.Generator) -> Sequence:
+    # A canonical haplotype of num_segments segments with random ends and ids (adjacent ids differ)
+    # (drawn positions that coincide, rare on a genome-sized sequence, give one segment less)
+    ends = np.append(np.unique(rng.integers(1, seq_len, size=num_segments - 1)), np.int64(seq_len))
+    num_segments = len(ends)
+    steps = rng.integers(1, num_ids, size=num_segments)
+    steps[0] = rng.integers(0, num_ids)
+    ids = np.cumsum(steps) % num_ids
+    return Sequence(ids.astype(np.int64), ends)
+
+
+def make_chrom_pair(num_segments: int, seq_len: int, num_ids: int, rng: np.random.Generator) -> ChromPair:
+    ind = ChromPair()
+    ind.chrom_pair = [make_sequence(num_segments, seq_len, num_ids, rng), make_sequence(num_segments, seq_len, num_ids, rng)]
+    return ind
+
+
+def bench_sequence(segment_counts: List[int], seq_len: int, num_breaks: int, repeats: int, seed: int) -> dict:
+    # Sequence.get_sequence, ChromPair.get_chrom, get_ibd_length and get_roh on haplotypes of
+    # segment_counts segments; the few distinct ids make IBD segments and runs of homozygosity common
+    rows = []
+    for num_segments in segment_counts:
+        rng = np.random.default_rng(seed)
+        ind = make_chrom_pair(num_segments, seq_len, 8, rng)
+        other = make_chrom_pair(num_segments, seq_len, 8, rng)
+        windows = np.sort(rng.integers(0, seq_len, size=(100, 2)), axis=1).tolist()
+        break_pos = sorted(rng.integers(1, seq_len - 1, size=num_breaks).tolist()) + [seq_len]
+        seq = ind.chrom_pair[0]
+        rows.append({
+            'num_segments': num_segments,
+            'get_sequence_seconds': time_call(lambda: [seq.get_sequence(start, end) for start, end in windows], repeats) / len(windows),
+            'get_chrom_seconds': time_call(lambda: ind.get_chrom(break_pos), repeats),
+            'get_ibd_length_seconds': time_call(lambda: ind.get_ibd_length(other), repeats),
+            'get_roh_seconds': time_call(lambda: ind.get_roh(seq_len), repeats),
+        })
+    time_keys = ['get_sequence_seconds', 'get_chrom_seconds', 'get_ibd_length_seconds', 'get_roh_seconds']
+    return {'rows': rows, 'exponents': fit_exponents(rows, 'num_segments', time_keys)}
+
+
+def bench_break_pos(pop_sizes: List[int], chrom_lengths: List[int], recomb_rate: float, repeats: int, seed: int) -> dict:
+    # Break positions of a whole generation: Individual.set_break_pos per individual against draw_generation_break_pos
+    chrom_break_pos = get_chrom_break_pos(chrom_lengths)
+    rows = []
+    for pop_size in pop_sizes:
+        inds = [Individual() for j in range(pop_size)]
+        random.seed(seed)
+        np.random.seed(seed)
+        rng = np.random.default_rng(seed)
+        old_time = time_call(lambda: [ind.set_break_pos(chrom_break_pos, recomb_rate) for ind in inds], repeats)
+        new_time = time_call(lambda: draw_generation_break_pos(rng, pop_size, chrom_break_pos, recomb_rate), repeats)
+        rows.append({'pop_size': pop_size, 'set_break_pos_seconds': old_time, 'draw_generation_break_pos_seconds': new_time, 'speedup': old_time / new_time})
+    return {'rows': rows, 'exponents': fit_exponents(rows, 'pop_size', ['set_break_pos_seconds', 'draw_generation_break_pos_seconds'])}
+
+
+def make_pedigree(pop_size: int, num_gen: int, seed: int) -> List[Generation]:
+    # A random-mating pedigree (uniform random mom in the first half, dad in the second half)
+    rng = np.random.default_rng(seed)
+    pop = [Generation(pop_size) for i in range(num_gen)]
+    for i in range(1, num_gen):
+        pop[i].mom_id = rng.integers(0, pop_size // 2, size=pop_size)
+        pop[i].dad_id = rng.integers(pop_size // 2, pop_size, size=pop_size)
+        pop[i - 1].set_children(pop[i])
+    return pop
+
+
+def bench_genealogical(pop_sizes: List[int], num_gens: List[int], repeats: int, seed: int) -> dict:
+    # The genealogical ancestor and descendant searches on random-mating pedigrees
+    rows = []
+    for num_gen in num_gens:
+        for pop_size in pop_sizes:
+            pop = make_pedigree(pop_size, num_gen, seed)
+            rows.append({
+                'pop_size': pop_size,
+                'num_gen': num_gen,
+                'genealogical_ancestors_seconds': time_call(lambda: get_genealogical_ancestors(ReversedPedigree(pop)), repeats),
+                'genealogical_descendants_seconds': time_call(lambda: get_genealogical_descendants(pop), repeats),
+            })
+    time_keys = ['genealogical_ancestors_seconds', 'genealogical_descendants_seconds']
+    return {'rows': rows, 'exponents': fit_exponents(rows, 'pop_size', time_keys, ['num_gen']) + fit_exponents(rows, 'num_gen', time_keys, ['pop_size'])}
+
+
+def bench_forward(pop_sizes: List[int], num_gens: List[int], kappa_parameters: List[float], chrom_len_file: str, seed: int) -> dict:
+    # Stage runtimes of forward.py runs (the stage totals of the instrumentation), one run per grid point
+    from forward import get_parser, run
+    rows = []
+    for kappa_parameter in kappa_parameters:
+        for num_gen in num_gens:
+            for pop_size in pop_sizes:
+                argv = ['-p', str(pop_size), '-g', str(num_gen), '-k', str(kappa_parameter), '-s', str(seed), '--instrument', 'stage']
+                if chrom_len_file:
+                    argv += ['-f', chrom_len_file]
+                args = get_parser().parse_args(argv)
+                start_time = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                    run(args)
+                row = {'pop_size': pop_size, 'num_gen': num_gen, 'kappa_parameter': kappa_parameter, 'total_seconds': time.perf_counter() - start_time}
+                for name, seconds in instrumentation.get_report()['seconds'].items():
+                    row[name + '_seconds'] = seconds
+                rows.append(row)
+    instrumentation.set_level('off')
+    time_keys = sorted(set(key for row in rows for key in row if key.endswith('_seconds')))
+    for row in rows:
+        for key in time_keys:
+            row.setdefault(key, 0.0)
+    return {'rows': rows, 'exponents': fit_exponents(rows, 'pop_size', time_keys, ['num_gen', 'kappa_parameter']) + fit_exponents(rows, 'num_gen', time_keys, ['pop_size', 'kappa_parameter'])}
+
+
+ENTRY_POINTS = ['forward', 'sweep', 'population', 'transmission', 'ibd_analysis', 'genetic_descentants', 'benchmark']
+HEAVY_MODULES = ['sympy', 'matplotlib', 'scipy']
+
+
+def bench_imports(modules: List[str], repeats: int) -> dict:
+    # Import time of every entry point in a fresh interpreter (best of repeats), and the heavy optional
+    # dependencies the import pulls in
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    code = ('import sys, time\n'
+            'start_time = time.perf_counter()\n'
+            'import {module}\n'
+            'print(time.perf_counter() - start_time)\n'
+            'print(" ".join(name for name in {heavy} if name in sys.modules))')
+    rows = []
+    for module in modules:
+        best = float('inf')
+        for _ in range(repeats):
+            output = subprocess.run([sys.executable, '-c', code.format(module=module, heavy=HEAVY_MODULES)], cwd=package_dir, capture_output=True, text=True, check=True).stdout.split('\n')
+            best = min(best, float(output[0]))
+        rows.append({'module': module, 'import_seconds': best, 'heavy_modules': output[1].split()})
+    return {'rows': rows}
+
+
+def compare_results(old: dict, new: dict) -> dict:
+    # new / old time of every timing of the rows with the same grid point (below 1 is faster)
+    comparison = {}
+    for name, new_result in new.items():
+        if name not in old or not isinstance(new_result, dict):
+            continue
+        old_rows = old[name]['rows']
+        ratios = []
+        for row in new_result['rows']:
+            point = {key: value for key, value in row.items() if not key.endswith('_seconds') and key not in ('speedup', 'heavy_modules')}
+            for old_row in old_rows:
+                if all(old_row.get(key) == value for key, value in point.items()):
+                    ratio = dict(point)
+                    for key, value in row.items():
+                        if key.endswith('_seconds') and old_row.get(key):
+                            ratio[key.replace('_seconds', '_ratio')] = value / old_row[key]
+                    ratios.append(ratio)
+                    break
+        comparison[name] = ratios
+    return comparison
+
+
+def get_commit() -> str:
+    try:
+        # Commit of the benchmarked code, wherever the benchmark is run from
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+BENCHMARKS = ('find_single_male_partner', 'sequence', 'break_pos', 'genealogical', 'forward', 'imports')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hot paths of the simulation')
+    parser.add_argument('--benchmarks', type=str, nargs='+', default=list(BENCHMARKS), choices=BENCHMARKS, help='Benchmarks to run')
+    parser.add_argument('-p', '--pop_sizes', type=int, nargs='+', default=[100, 1000, 4000], help='Population sizes')
+    parser.add_argument('-g', '--num_gens', type=int, nargs='+', default=[10, 40], help='Numbers of generations (genealogical and forward benchmarks)')
+    parser.add_argument('--forward_pop_sizes', type=int, nargs='+', default=[25, 50, 100], help='Population sizes of the forward benchmark')
+    parser.add_argument('--segment_counts', type=int, nargs='+', default=[100, 1000, 10000, 100000], help='Segments per haplotype (sequence benchmark)')
+    parser.add_argument('-k', '--kappa_parameter', type=float, nargs='+', default=[2.0], help='Kappa parameters')
+    parser.add_argument('-f', '--chrom_len_file', type=str, default='', help='Filepath of chromosome lengths file (break_pos and forward benchmarks)')
+    parser.add_argument('-r', '--recomb_rate', type=float, default=1e-8, help='Recombination rate (break_pos benchmark)')
+    parser.add_argument('-m', '--num_moms', type=int, default=50, help='Number of mothers searching per repeat')
+    parser.add_argument('-n', '--repeats', type=int, default=3, help='Repeats per measurement (best is kept)')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='Seed for the synthetic inputs')
+    parser.add_argument('--out_file', type=str, default='', help='JSON file for the results')
+    parser.add_argument('--compare', type=str, default='', help='Results JSON of an earlier run (e.g. another commit) to compare with')
+    args = parser.parse_args()
+
+    chrom_lengths = read_file(args.chrom_len_file) if args.chrom_len_file else [3000000000]
+    data = {'commit': get_commit(), 'seed': args.seed, 'repeats': args.repeats}
+    if 'find_single_male_partner' in args.benchmarks:
+        rows = []
+        for kappa_parameter in args.kappa_parameter:
+            for row in bench_find_single_male_partner(args.pop_sizes, kappa_parameter, args.num_moms, args.repeats, args.seed):
+                rows.append(dict(row, kappa_parameter=kappa_parameter))
+        data['find_single_male_partner'] = {'rows': rows, 'exponents': fit_exponents(rows, 'pop_size', ['old_seconds_per_mom', 'new_seconds_per_mom'], ['kappa_parameter'])}
+    if 'sequence' in args.benchmarks:
+        data['sequence'] = bench_sequence(args.segment_counts, sum(chrom_lengths), 30, args.repeats, args.seed)
+    if 'break_pos' in args.benchmarks:
+        data['break_pos'] = bench_break_pos(args.pop_sizes, chrom_lengths, args.recomb_rate, args.repeats, args.seed)
+    if 'genealogical' in args.benchmarks:
+        data['genealogical'] = bench_genealogical(args.pop_sizes, args.num_gens, args.repeats, args.seed)
+    if 'forward' in args.benchmarks:
+        data['forward'] = bench_forward(args.forward_pop_sizes, args.num_gens, args.kappa_parameter, args.chrom_len_file, args.seed)
+
+    if 'imports' in args.benchmarks:
+        data['imports'] = bench_imports(ENTRY_POINTS, args.repeats)
+
+    if args.compare:
+        with open(args.compare, 'r') as json_file:
+            old = json.load(json_file)
+        data['comparison'] = {'commit': old.get('commit', ''), 'ratios': compare_results(old, data)}
+    print_json(data)
+    if args.out_file:
+        with open(args.out_file, 'w') as json_file:
+            json.dump(data, json_file, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
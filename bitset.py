@@ -0,0 +1,62 @@
+import numpy as np
+
+# Sets of individuals packed as rows of uint64 words: bit j % 64 of word j // 64 in a row
+# is set when individual j is in the set of that row.
+
+# Number of set bits per byte value, used when np.bitwise_count is not available (numpy < 2.0)
+POPCOUNT_TABLE = np.array([bin(b).count('1') for b in range(256)], dtype=np.uint8)
+
+
+def num_words(n: int) -> int:
+    return (n + 63) // 64
+
+
+def identity_bitset(n: int) -> np.ndarray:
+    # Row j holds the set {j}
+    bits = np.zeros((n, num_words(n)), dtype=np.uint64)
+    j = np.arange(n)
+    bits[j, j // 64] = np.left_shift(np.uint64(1), (j % 64).astype(np.uint64))
+    return bits
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    # Number of set bits of every uint64 word
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    counts = POPCOUNT_TABLE[np.ascontiguousarray(words).view(np.uint8)]
+    return counts.reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def row_popcount(bits: np.ndarray) -> np.ndarray:
+    # Size of the set in every row
+    return popcount(bits).sum(axis=1, dtype=np.int64)
+
+
+def propagate_rows(bits: np.ndarray, targets: np.ndarray, size: int) -> np.ndarray:
+    # ORs row k of bits into row targets[k] of a new (size x words) bitset; targets equal to -1 are skipped
+    result = np.zeros((size, bits.shape[1]), dtype=np.uint64)
+    valid = targets >= 0
+    np.bitwise_or.at(result, targets[valid], bits[valid])
+    return result
+
+
+def unpack_bits(bits: np.ndarray, n: int) -> np.ndarray:
+    # Boolean (rows x n) matrix of the first n columns
+    bytes_ = np.ascontiguousarray(bits.astype('<u8')).view(np.uint8).reshape(len(bits), 8 * bits.shape[1])
+    return np.unpackbits(bytes_, axis=1, count=n, bitorder='little').astype(bool)
+
+
+def pack_bits(columns: np.ndarray) -> np.ndarray:
+    # Packs a boolean (rows x n) matrix into rows of uint64 words
+    rows, n = columns.shape
+    bytes_ = np.zeros((rows, 8 * num_words(n)), dtype=np.uint8)
+    bytes_[:, :(n + 7) // 8] = np.packbits(columns, axis=1, bitorder='little')
+    return bytes_.view('<u8').astype(np.uint64)
+
+
+def column_popcount(bits: np.ndarray, n: int, chunk_size: int = 4096) -> np.ndarray:
+    # Number of rows having each of the first n columns set, unpacking chunk_size rows at a time
+    counts = np.zeros(n, dtype=np.int64)
+    for start in range(0, len(bits), chunk_size):
+        counts += unpack_bits(bits[start:start + chunk_size], n).sum(axis=0)
+    return counts
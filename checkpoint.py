@@ -0,0 +1,80 @@
+from typing import List, Tuple
+import json
+import os
+import random
+import numpy as np
+from generation import Generation
+from pedigree_store import save_generation, load_generation
+
+# Checkpoints of long runs, written atomically (to a temporary file, then renamed):
+#   pedigree checkpoint (directory)  the arrays of every generation simulated so far, one .npy file per array
+#                                    as in a pedigree store (pedigree_store.py), and checkpoint.json with the
+#                                    random states and the partial statistics of the run
+#   stage checkpoint (.json)         the results of the analyses finished so far and the random states
+# Restoring the random states of `random`, `np.random` and the recombination Generator makes a
+# resumed run draw exactly the same numbers as an uninterrupted one.
+
+
+def get_random_state(rng: np.random.Generator = None) -> dict:
+    np_state = np.random.get_state(legacy=False)
+    np_state['state']['key'] = np_state['state']['key'].tolist()
+    return {'random': random.getstate(), 'np_random': np_state, 'rng': None if rng is None else rng.bit_generator.state}
+
+
+def set_random_state(state: dict, rng: np.random.Generator = None) -> None:
+    version, internal_state, gauss_next = state['random']
+    random.setstate((version, tuple(internal_state), gauss_next))
+    np_state = state['np_random']
+    np_state['state']['key'] = np.array(np_state['state']['key'], dtype=np.uint32)
+    np.random.set_state(np_state)
+    if rng is not None:
+        rng.bit_generator.state = state['rng']
+
+
+class PedigreeCheckpoint:
+    # Pedigree checkpoint in directory path. A generation changes once the next one is formed (the couples
+    # set pair_id, then the children are set), so a checkpoint rewrites the last generation of the previous
+    # checkpoint and writes the new ones: the total I/O is linear in the number of generations.
+    # checkpoint.json is replaced last. The last saved generation is loaded without couples and children, as
+    # it was when saved, so the files of a later, interrupted checkpoint do not change a resumed run.
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.num_saved_gen = 0
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, 'checkpoint.json'))
+
+    def save(self, pop: List[Generation], meta: dict) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        for i in range(max(self.num_saved_gen - 1, 0), len(pop)):
+            save_generation(self.path, i, pop[i])
+        meta_path = os.path.join(self.path, 'checkpoint.json')
+        with open(meta_path + '.tmp', 'w') as file:
+            json.dump(dict(meta, num_saved_gen=len(pop)), file)
+        os.replace(meta_path + '.tmp', meta_path)
+        self.num_saved_gen = len(pop)
+
+    def load(self) -> Tuple[List[Generation], dict]:
+        with open(os.path.join(self.path, 'checkpoint.json'), 'r') as file:
+            meta = json.load(file)
+        pop = [load_generation(self.path, i) for i in range(meta['num_saved_gen'])]
+        last_gen = pop[-1]
+        last_gen.pair_id = np.full(len(last_gen), -1, dtype=np.int64)
+        last_gen.children_offsets = np.zeros(len(last_gen) + 1, dtype=np.int64)
+        last_gen.children_ids = np.empty(0, dtype=np.int64)
+        self.num_saved_gen = len(pop)
+        return pop, meta
+
+
+def save_stage_checkpoint(path: str, data: dict) -> None:
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'data': data, 'random_state': get_random_state()}, file)
+    os.replace(path + '.tmp', path)
+
+
+def load_stage_checkpoint(path: str) -> dict:
+    # Restores the random states and returns the results saved so far
+    with open(path, 'r') as file:
+        checkpoint = json.load(file)
+    set_random_state(checkpoint['random_state'])
+    return checkpoint['data']
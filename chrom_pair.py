@@ -1,22 +1,136 @@
 from typing import List, Tuple
+import numpy as np
 from sequence import Sequence
+from chrom_break_pos import get_chrom_break_pos
+
+def get_break_intervals(break_pos: List[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Non-empty intervals [starts[k], ends[k]) of a gamete and the chromosome copy (0 or 1)
+    # each one is copied from. The gamete starts on copy 0 up to break_pos[0] and switches
+    # copy after [0, break_pos[0]) and after every non-empty interval, as get_chrom always did.
+    break_pos = np.asarray(break_pos, dtype=np.int64)
+    starts = np.concatenate(([0], break_pos[:-1]))
+    non_empty = break_pos > starts
+    # Switches before interval k: one after the first interval, one after each non-empty one in between
+    switches = np.cumsum(non_empty) - non_empty
+    switches[1:] += 1 - non_empty[0]
+    chrom_index = switches % 2
+    return starts[non_empty], break_pos[non_empty], chrom_index[non_empty]
+
+
+def get_generation_break_intervals(offsets: np.ndarray, break_pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # get_break_intervals for many meioses at once, with break positions stored CSR-style
+    # (the break positions of meiosis m are break_pos[offsets[m]:offsets[m + 1]]).
+    # Returns the CSR offsets of the non-empty intervals and their starts, ends and copies.
+    num_meioses = len(offsets) - 1
+    meiosis = np.repeat(np.arange(num_meioses), np.diff(offsets))
+    first = offsets[:-1][meiosis]
+    is_first = np.arange(len(break_pos)) == first
+    starts = np.concatenate(([0], break_pos[:-1]))
+    starts[is_first] = 0
+    non_empty = break_pos > starts
+    # Switches before each interval, counted within its own meiosis
+    switches = np.cumsum(non_empty) - non_empty
+    switches -= switches[first]
+    switches += np.where(is_first, 0, 1 - non_empty[first])
+    chrom_index = switches % 2
+    interval_offsets = np.zeros(num_meioses + 1, dtype=np.int64)
+    interval_offsets[1:] = np.cumsum(np.bincount(meiosis[non_empty], minlength=num_meioses))
+    return interval_offsets, starts[non_empty], break_pos[non_empty], chrom_index[non_empty]
+
+
+def get_sequence_ibd_length(my_ids: List[int], my_ends: List[int], other_ids: List[int], other_ends: List[int], overlaps: list = None) -> int:
+    # Length shared by two sequences given as lists of segment ids and ends: a two-pointer merge
+    # over the segments, adding the overlap of every pair of segments with the same ancestor.
+    # With overlaps, every shared piece is also appended to it as (start, end, ancestor id).
+    ibd_length = 0
+    i, j = 0, 0  # Pointers for my_seq and other_seq segments
+    my_start, other_start = 0, 0  # Track start positions in each sequence
+
+    while i < len(my_ids) and j < len(other_ids):
+        my_end = my_ends[i]
+        other_end = other_ends[j]
+
+        # Check if the IDs match (same ancestor)
+        if my_ids[i] == other_ids[j]:
+            # Compute the overlap between the two segments
+            overlap_start = max(my_start, other_start)
+            overlap_end = min(my_end, other_end)
+
+            # Add the overlapping length to the IBD total (if there is overlap)
+            if overlap_start < overlap_end:
+                ibd_length += overlap_end - overlap_start
+                if overlaps is not None:
+                    overlaps.append((overlap_start, overlap_end, my_ids[i]))
+
+        # Move to the next segment in the sequence with the smaller end position
+        if my_end <= other_end:
+            my_start = my_end
+            i += 1
+        else:
+            other_start = other_end
+            j += 1
+
+    return ibd_length
+
+
+def get_total_ibd_length(chrom_pairs: List["ChromPair"]) -> int:
+    # Sum of get_ibd_length over all pairs, without visiting the pairs: at every position, the
+    # number of pairs sharing an ancestor on copy c is the sum over ids of C(count, 2), where count
+    # is the number of individuals carrying the id there. For each copy, the segments are turned
+    # into +1/-1 events at their start/end, sorted by (id, position), and the running count of
+    # each id gives the pairs sharing it until the next event.
+    ibd_length = 0
+    for chrom_index in range(2):
+        seqs = [ind.chrom_pair[chrom_index] for ind in chrom_pairs]
+        ids = np.concatenate([seq.ids for seq in seqs])
+        ends = np.concatenate([seq.ends for seq in seqs])
+        starts = ends - np.concatenate([seq.lengths for seq in seqs])
+        event_ids = np.concatenate((ids, ids))
+        event_pos = np.concatenate((starts, ends))
+        event_delta = np.concatenate((np.ones(len(ids), dtype=np.int64), np.full(len(ids), -1, dtype=np.int64)))
+        order = np.lexsort((event_pos, event_ids))
+        event_pos = event_pos[order]
+        # The events of every id sum to zero, so the running count drops to 0 between ids
+        counts = np.cumsum(event_delta[order])
+        pairs = counts * (counts - 1) // 2
+        ibd_length += int((pairs[:-1] * np.diff(event_pos)).sum())
+    return ibd_length
+
 
 class ChromPair:
     def __init__(self):
         # chrom_pair is expected to be a list with two Sequence objects
         self.chrom_pair = [Sequence(), Sequence()]
 
-    def get_chrom(self, break_pos: List[int]) -> Sequence:
-        chrom_index = 0
-        # Access the first sequence's chromosome data
-        seq = self.chrom_pair[chrom_index].get_sequence(0, break_pos[0])
-        chrom_index = 1 - chrom_index
-
-        for i in range(len(break_pos) - 1):
-            if break_pos[i] != break_pos[i + 1]:
-                seq.extend(self.chrom_pair[chrom_index].get_sequence(break_pos[i], break_pos[i + 1]))
-                chrom_index = 1 - chrom_index
+    @classmethod
+    def get_founder(cls, id: int, chrom_lengths: List[int]) -> "ChromPair":
+        # Both copies carry `id` on every chromosome; chromosome starts are never merged over
+        founder = cls()
+        boundaries = np.asarray(get_chrom_break_pos(chrom_lengths), dtype=np.int64)
+        for chrom_index in range(2):
+            founder.chrom_pair[chrom_index].boundaries = boundaries
+            for chrom_length in chrom_lengths:
+                founder.chrom_pair[chrom_index].add_segment(id, chrom_length)
+        return founder
 
+    def get_chrom(self, break_pos: List[int]) -> Sequence:
+        # One pass over the break intervals: for every interval, the overlapping segments of the
+        # copy it is taken from are found by binary search and gathered with a single take.
+        starts, ends, chrom_index = get_break_intervals(break_pos)
+        first = np.empty(len(starts), dtype=np.int64)
+        last = np.empty(len(starts), dtype=np.int64)
+        for k in range(2):
+            selected = chrom_index == k
+            first[selected], last[selected] = self.chrom_pair[k].get_segment_range(starts[selected], ends[selected])
+        # Index the two copies as one array: copy 1 follows copy 0
+        offset = np.where(chrom_index == 1, len(self.chrom_pair[0].ids), 0)
+        counts = last - first + 1
+        seg_index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - first - offset, counts)
+        ids = np.concatenate((self.chrom_pair[0].ids, self.chrom_pair[1].ids))[seg_index]
+        seg_ends = np.concatenate((self.chrom_pair[0].ends, self.chrom_pair[1].ends))[seg_index]
+        seq = Sequence(ids, np.minimum(seg_ends, np.repeat(ends, counts)), self.chrom_pair[0].boundaries)
+        # Pieces of consecutive intervals may come from the same ancestor
+        seq.coalesce()
         return seq
     
     def get_ibd_length_whole_segments(self, other: "ChromPair") -> int:
@@ -33,9 +147,8 @@ class ChromPair:
 
             # Compare segment-by-segment
             min_length = min(len(my_seq.ids), len(other_seq.ids))
-            for i in range(min_length):
-                if my_seq.ids[i] == other_seq.ids[i]:  # Check if segments are identical
-                    ibd_length += my_seq.lengths[i]  # Sum the length of shared segments
+            shared = my_seq.ids[:min_length] == other_seq.ids[:min_length]  # Check if segments are identical
+            ibd_length += int(my_seq.lengths[:min_length][shared].sum())  # Sum the length of shared segments
 
         return ibd_length
     
@@ -44,56 +157,50 @@ class ChromPair:
 
         # Compare the two sequences (chromosome pairs)
         for my_seq, other_seq in zip(self.chrom_pair, other.chrom_pair):
-            i, j = 0, 0  # Pointers for my_seq and other_seq segments
-            my_start, other_start = 0, 0  # Track start positions in each sequence
-
-            while i < len(my_seq.ids) and j < len(other_seq.ids):
-                # Check if the IDs match (same ancestor)
-                if my_seq.ids[i] == other_seq.ids[j]:
-                    # Compute the overlap between the two segments
-                    my_end = my_start + my_seq.lengths[i]
-                    other_end = other_start + other_seq.lengths[j]
-
-                    overlap_start = max(my_start, other_start)
-                    overlap_end = min(my_end, other_end)
-
-                    # Add the overlapping length to the IBD total (if there is overlap)
-                    if overlap_start < overlap_end:
-                        ibd_length += overlap_end - overlap_start
-
-                # Move to the next segment in the sequence with the smaller end position
-                if my_start + my_seq.lengths[i] <= other_start + other_seq.lengths[j]:
-                    my_start += my_seq.lengths[i]
-                    i += 1
-                else:
-                    other_start += other_seq.lengths[j]
-                    j += 1
+            ibd_length += get_sequence_ibd_length(my_seq.ids.tolist(), my_seq.ends.tolist(), other_seq.ids.tolist(), other_seq.ends.tolist())
 
         return ibd_length
 
-
-    def get_roh(self, seq_len: int) -> Tuple[int, int]:
-        # Merge break positions from both chromosome sequences
-        break_pos = [0]
-        break_pos.append(self.chrom_pair[0].lengths[0])
-
-        for k in range(1, len(self.chrom_pair[0].lengths)):
-            break_pos.append(break_pos[k - 1] + self.chrom_pair[0].lengths[k])
-
-        break_pos.append(self.chrom_pair[1].lengths[0])
-        for k in range(1, len(self.chrom_pair[1].lengths)):
-            break_pos.append(break_pos[k - 1] + self.chrom_pair[1].lengths[k])
-
-        break_pos.sort()
-        break_pos.append(seq_len)
-
-        # Find ROH for each block
-        roh_length = 0
-        roh_count = 0
-        for i in range(len(break_pos) - 1):
-            if break_pos[i] != break_pos[i + 1]:
-                # Compare sequence IDs to determine if ROH exists
-                if self.chrom_pair[0].get_sequence(break_pos[i], break_pos[i + 1]).ids[0] == self.chrom_pair[1].get_sequence(break_pos[i], break_pos[i + 1]).ids[0]:
-                    roh_length += (break_pos[i + 1] - break_pos[i])
-                    roh_count += 1
-        return roh_length, roh_count
\ No newline at end of file
+    def get_ibd_segments(self, other: "ChromPair") -> List[Tuple[int, int, int, int]]:
+        # Shared segments (chrom_index, start, end, ancestor id) of the two individuals, copy by copy,
+        # from the same merge as get_ibd_length (get_sequence_ibd_length), so their lengths sum to it.
+        # Sequences are canonical, so each overlap is already a maximal shared segment.
+        segments = []
+        for chrom_index, (my_seq, other_seq) in enumerate(zip(self.chrom_pair, other.chrom_pair)):
+            overlaps = []
+            get_sequence_ibd_length(my_seq.ids.tolist(), my_seq.ends.tolist(), other_seq.ids.tolist(), other_seq.ends.tolist(), overlaps)
+            segments.extend((chrom_index, start, end, id) for start, end, id in overlaps)
+        return segments
+
+    def get_roh_runs(self) -> Tuple[np.ndarray, np.ndarray]:
+        # Runs of homozygosity: maximal intervals where both copies carry the same ancestor id.
+        # One sweep over the merged segment ends of the two copies: each elementary interval
+        # between consecutive ends lies inside exactly one segment of each copy.
+        seq0, seq1 = self.chrom_pair
+        cut_pos = np.union1d(seq0.ends, seq1.ends)
+        ids0 = seq0.ids[np.searchsorted(seq0.ends, cut_pos, side='left')]
+        ids1 = seq1.ids[np.searchsorted(seq1.ends, cut_pos, side='left')]
+        homozygous = ids0 == ids1
+
+        # An elementary interval continues the run of the previous one if both are homozygous
+        # for the same id and no chromosome starts between them
+        continues = np.zeros(len(cut_pos), dtype=bool)
+        continues[1:] = homozygous[1:] & homozygous[:-1] & (ids0[1:] == ids0[:-1]) & ~seq0.is_boundary(cut_pos[:-1])
+        run_start = homozygous & ~continues
+        run_end = homozygous & ~np.append(continues[1:], False)
+
+        starts = np.concatenate(([0], cut_pos[:-1]))
+        return starts[run_start], cut_pos[run_end]
+
+    def get_roh(self, seq_len: int, roh_bins: List[int] = None):
+        # Total length and number of runs of homozygosity.
+        # With roh_bins (edges of ROH length classes) the number of runs per class is returned as well.
+        # The runs always cover [0, seq_len), seq_len is kept for compatibility.
+        starts, ends = self.get_roh_runs()
+        roh_lengths = ends - starts
+        roh_length = int(roh_lengths.sum())
+        roh_count = len(roh_lengths)
+        if roh_bins is None:
+            return roh_length, roh_count
+        roh_hist, _ = np.histogram(roh_lengths, bins=roh_bins)
+        return roh_length, roh_count, roh_hist
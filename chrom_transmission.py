@@ -0,0 +1,83 @@
+from typing import List, Tuple
+import numpy as np
+from auxiliary_functions import get_pool_context
+from chrom_break_pos import get_chrom_break_pos
+from chrom_pair import get_generation_break_intervals
+from generation import Generation, as_generation
+from individual import Individual
+from transmission import ReducibleCollector, transmit_genome
+
+# Transmission of the genome one chromosome at a time. Segments never span two chromosomes,
+# so every chromosome can be transmitted through the pedigree on its own (in its own process)
+# with break positions relative to the chromosome start. Reducible collectors measure every
+# chromosome separately and their partials are combined into the whole-genome statistics.
+
+
+def get_chromosome_break_pos(offsets: np.ndarray, break_pos: np.ndarray, lo: int, hi: int) -> Tuple[np.ndarray, np.ndarray]:
+    # Break positions (CSR-style, as in Generation) of many meioses restricted to the chromosome
+    # [lo, hi), relative to lo: a leading 0 if the gamete is on copy 1 at lo (the empty first
+    # interval switches copy), the break positions inside (lo, hi) and the chromosome length.
+    if len(break_pos) == 0:
+        # No meiosis recorded (founders)
+        return offsets.copy(), break_pos.copy()
+    num_meioses = len(offsets) - 1
+    interval_offsets, starts, ends, chrom_index = get_generation_break_intervals(offsets, break_pos)
+    interval_meiosis = np.repeat(np.arange(num_meioses), np.diff(interval_offsets))
+    at_lo = (starts <= lo) & (ends > lo)
+    on_copy_1 = np.zeros(num_meioses, dtype=bool)
+    on_copy_1[interval_meiosis[at_lo]] = chrom_index[at_lo] == 1
+
+    meiosis = np.repeat(np.arange(num_meioses), np.diff(offsets))
+    inside = (break_pos > lo) & (break_pos < hi)
+    copy_1_meioses = np.flatnonzero(on_copy_1)
+    meioses = np.arange(num_meioses)
+    owners = np.concatenate((copy_1_meioses, meiosis[inside], meioses))
+    positions = np.concatenate((np.zeros(len(copy_1_meioses), dtype=np.int64), break_pos[inside] - lo, np.full(num_meioses, hi - lo, dtype=np.int64)))
+    order = np.lexsort((positions, owners))
+    local_offsets = np.zeros(num_meioses + 1, dtype=np.int64)
+    local_offsets[1:] = np.cumsum(np.bincount(owners, minlength=num_meioses))
+    return local_offsets, positions[order]
+
+
+def restrict_to_chromosome(gen: List[Individual], lo: int, hi: int) -> Generation:
+    # Parents and break positions of a generation for the chromosome [lo, hi) alone
+    gen = as_generation(gen)
+    chrom_gen = Generation(len(gen))
+    chrom_gen.mom_id, chrom_gen.dad_id = gen.mom_id, gen.dad_id
+    chrom_gen.mom_break_offsets, chrom_gen.mom_break_pos = get_chromosome_break_pos(gen.mom_break_offsets, gen.mom_break_pos, lo, hi)
+    chrom_gen.dad_break_offsets, chrom_gen.dad_break_pos = get_chromosome_break_pos(gen.dad_break_offsets, gen.dad_break_pos, lo, hi)
+    return chrom_gen
+
+
+def transmit_chromosome(task: Tuple[List[Generation], int, List[ReducibleCollector]]) -> List[tuple]:
+    # Transmits one chromosome and returns (partials, per-chromosome result) of every collector
+    chrom_pop, chrom_length, collectors = task
+    transmit_genome(chrom_pop, [chrom_length], collectors)
+    return [(collector.partials, collector.get_result()) for collector in collectors]
+
+
+def transmit_genome_by_chromosome(pop: List[List[Individual]], chrom_lengths: List[int], collectors: List[ReducibleCollector], workers: int = 1) -> List[list]:
+    # transmit_genome with every chromosome transmitted and measured separately, in a pool of
+    # workers processes (in this process if workers is 1). The collectors end up with the same
+    # whole-genome results as after transmit_genome; the per-chromosome results are returned
+    # as well, one list (ordered as collectors) per chromosome.
+    for collector in collectors:
+        if not isinstance(collector, ReducibleCollector):
+            raise ValueError(f"{type(collector).__name__} cannot be computed per chromosome")
+    chrom_break_pos = get_chrom_break_pos(chrom_lengths)
+    generations = [as_generation(gen) for gen in pop]
+    tasks = []
+    for c in range(len(chrom_lengths)):
+        lo, hi = chrom_break_pos[c], chrom_break_pos[c + 1]
+        chrom_pop = [restrict_to_chromosome(gen, lo, hi) for gen in generations]
+        tasks.append((chrom_pop, chrom_lengths[c], [collector.new_part() for collector in collectors]))
+
+    if workers > 1:
+        with get_pool_context().Pool(workers) as pool:
+            chrom_results = pool.map(transmit_chromosome, tasks)
+    else:
+        chrom_results = [transmit_chromosome(task) for task in tasks]
+
+    for k, collector in enumerate(collectors):
+        collector.reduce([results[k][0] for results in chrom_results])
+    return [[result for _, result in results] for results in chrom_results]
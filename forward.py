@@ -6,17 +6,19 @@ import sys
 import json
 import os
 from datetime import datetime
-from tqdm import tqdm
 from auxiliary_functions import read_file, sum_list_of_int, print_json
-from population import get_forward_population_gender_based_monoamorous_couples
+from population import get_forward_population_gender_based_monoamorous_couples, iterate_forward_population_gender_based_monoamorous_couples
 from genealogical_ancestors import get_genealogical_ancestors
-from genetic_ancestors import get_genetic_ancestors
+from genetic_ancestors import get_genetic_ancestors_all_depths
 from genealogical_descendants import get_genealogical_descendants
-from genetic_descentants import get_genetic_descendants
-from ibd_analysis import calculate_ibd_proportion
+from chrom_transmission import transmit_genome_by_chromosome
+from instrumentation import LEVELS, set_level, reset, add_time, write_report
+from checkpoint import save_stage_checkpoint, load_stage_checkpoint
+from pedigree_store import PedigreeStore, PedigreeWriter, ReversedPedigree, save_pedigree
+from transmission import transmit_genome, DescendantCollector, SegmentCollector, RohCollector, IbdCollector, SampledIbdCollector, IbdMatrixCollector
 
 
-def main():
+def get_parser() -> argparse.ArgumentParser:
     # Command-line argument parser
     parser = argparse.ArgumentParser(description='Simulation Parameters')
     parser.add_argument('-p', '--pop_size', type=int, default=100, help='Population size')
@@ -26,9 +28,49 @@ def main():
     parser.add_argument('-s', '--seed', type=int, default=0, help='Seed for random number generation')
     parser.add_argument('-k', '--kappa_parameter', type=float, default=1e-08, help='Kappa parameter')
     parser.add_argument('-a', '--avoid_relatives', type=str, default='', help='Avoid siblings or first cousins or both or leave it empty for not inbreeding avoidance. Possible values:"siblings", "cousins", "siblingscousins"')
+    parser.add_argument('--ibd_mode', type=str, default='pairwise', choices=['pairwise', 'aggregate', 'sampled'], help='IBD proportion over all pairs ("pairwise" or the equivalent faster "aggregate") or estimated from random pairs ("sampled")')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes comparing the pairs of individuals for --ibd_mode pairwise')
+    parser.add_argument('--ibd_pairs', type=int, default=1000, help='Number of random pairs per generation for --ibd_mode sampled')
+    parser.add_argument('--ibd_matrix_gens', type=int, nargs='*', default=[], help='Generations (0 = founders, negative values count from the last one) for which the N x N IBD matrix and the long shared segments are written to --ibd_matrix_dir')
+    parser.add_argument('--ibd_matrix_dir', type=str, default='', help='Output directory of the IBD matrices; an interrupted run with the same directory continues where it stopped')
+    parser.add_argument('--ibd_min_segment_len', type=int, default=1000000, help='Minimum length of the shared segments written with the IBD matrices')
+    parser.add_argument('--ibd_block_size', type=int, default=256, help='Rows of the IBD matrix computed and written at a time')
+    parser.add_argument('--chrom_workers', type=int, default=0, help='Transmit and measure every chromosome separately in a pool of this many processes and also report per-chromosome statistics (0: whole genome at once)')
+    parser.add_argument('--roh_bins', type=int, nargs='*', default=[], help='Edges of the ROH length classes (e.g. 0 1000000 2000000 4000000 8000000 16000000 3000000000). Leave it empty for no ROH length histogram')
+    parser.add_argument('--checkpoint_dir', type=str, default='', help='Directory of the checkpoints (pedigree/ while simulating, stages.json after every analysis). Leave it empty for no checkpoints')
+    parser.add_argument('--checkpoint_every', type=int, default=10, help='Generations between two pedigree checkpoints')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoints in --checkpoint_dir')
+    parser.add_argument('--stream', action='store_true', help='Simulate the generations one at a time and transmit the genomes as they are formed, with memory independent of the number of generations. The analyses that need the whole pedigree only run with --save_pedigree, on the pedigree written to disk')
+    parser.add_argument('--save_pedigree', type=str, default='', help='Directory where the simulated pedigree is saved, to be analysed later with --load_pedigree')
+    parser.add_argument('--load_pedigree', type=str, default='', help='Analyse the pedigree saved in this directory (memory-mapped) instead of simulating one; its simulation parameters replace -p, -g, -r, -f, -s, -k and -a')
+    parser.add_argument('--instrument', type=str, default='off', choices=LEVELS, help='Timings and counters written to a timing_*.json report next to the results: "stage" for the totals of every stage and phase, "generation" also per generation')
+    parser.add_argument('-o', '--out_dir', type=str, default='/home/people/s222822/thesis/res/', help='Directory of the JSON results file')
+    return parser
 
 
-    args = parser.parse_args()
+def check_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    if args.ibd_matrix_gens and not args.ibd_matrix_dir:
+        parser.error('--ibd_matrix_gens requires --ibd_matrix_dir')
+    if args.resume and not args.checkpoint_dir:
+        parser.error('--resume requires --checkpoint_dir')
+    if args.load_pedigree and args.save_pedigree:
+        parser.error('--load_pedigree and --save_pedigree cannot be used together')
+    if args.stream and (args.load_pedigree or args.checkpoint_dir or args.chrom_workers > 0):
+        parser.error('--stream cannot be combined with --load_pedigree, --checkpoint_dir or --chrom_workers')
+    if args.chrom_workers > 0 and (args.ibd_mode == 'sampled' or args.ibd_matrix_gens):
+        parser.error('--chrom_workers cannot be combined with --ibd_mode sampled or --ibd_matrix_gens')
+
+
+def run(args: argparse.Namespace) -> dict:
+    # One simulation with the parameters of the command line (or the analysis of a saved pedigree); returns the results
+    set_level(args.instrument)
+    reset()
+    pedigree = None
+    if args.load_pedigree:
+        pedigree = PedigreeStore(args.load_pedigree)
+        args = argparse.Namespace(**vars(args))
+        for key in ('pop_size', 'num_gen', 'recomb_rate', 'seed', 'kappa_parameter', 'avoid_relatives'):
+            setattr(args, key, pedigree.meta[key])
 
     # Set seed for random number generator
     if args.seed != 0:
@@ -37,7 +79,9 @@ def main():
 
     # Read chromosome lengths from file (or use default)
     chrom_lengths = [3000000000]
-    if args.chrom_len_file:
+    if pedigree is not None:
+        chrom_lengths = pedigree.meta['chrom_lengths']
+    elif args.chrom_len_file:
         if len(args.chrom_len_file):
             print("Read file", file=sys.stderr)
             chrom_lengths = read_file(args.chrom_len_file)
@@ -52,6 +96,7 @@ def main():
         'seq_len': sum_list_of_int(chrom_lengths),
         'kappa_parameter': args.kappa_parameter,
         'avoid_relatives': args.avoid_relatives,
+        'ibd_mode': args.ibd_mode,
     }
     print(f'script started at: {datetime.now().strftime("%Y_%m_%d_%H_%M_%S")}', file=sys.stderr)
     print(data, file=sys.stderr)
@@ -64,79 +109,213 @@ def main():
     # Simulate forward-in-time population
     
     
-    print("Compute get_forward_population", file=sys.stderr)
-    start_time = time.perf_counter()
-    forward_pop,mom_time_list_per_gen, mom_time_list_per_gen_count, average_mom_time_all = get_forward_population_gender_based_monoamorous_couples(args.pop_size, args.num_gen, chrom_lengths, args.recomb_rate, args.kappa_parameter,args.avoid_relatives)
-    passed_time = time.perf_counter() - start_time
-    print(f"Finished get_forward_population in {str(round(passed_time, 2))} seconds", file=sys.stderr)
-    data['runtime_create_population_with_forward_method'] = passed_time
-    reversed_pop = list(reversed(forward_pop))
+    # Checkpoints: the pedigree (while it is simulated) and the results of every finished analysis
+    pedigree_path, stage_path = '', ''
+    if args.checkpoint_dir:
+        os.makedirs(args.checkpoint_dir, exist_ok=True)
+        pedigree_path = os.path.join(args.checkpoint_dir, 'pedigree')
+        stage_path = os.path.join(args.checkpoint_dir, 'stages.json')
+
+    if pedigree is not None:
+        print(f"Load the pedigree saved in {args.load_pedigree}", file=sys.stderr)
+        forward_pop = pedigree
+        mom_time_list_per_gen, mom_time_list_per_gen_count, average_mom_time_all = pedigree.meta['Average_time_mom_finds_a_partner_per_gen'], pedigree.meta['Number_of_moms_searched_for_a_partner_per_gen'], pedigree.meta['average_mom_time_all']
+        data['pedigree_dir'] = args.load_pedigree
+    elif args.stream:
+        # Simulation and genome transmission in one pass: every generation goes to the collectors as soon as
+        # its children exist and is then dropped (or only written to --save_pedigree), so memory does not grow
+        # with the number of generations
+        print("Compute get_forward_population with genome transmission (streamed)", file=sys.stderr)
+        start_time = time.perf_counter()
+        mom_times = {}
+        generations = iterate_forward_population_gender_based_monoamorous_couples(args.pop_size, args.num_gen, chrom_lengths, args.recomb_rate, args.kappa_parameter, args.avoid_relatives, mom_times=mom_times)
+        if args.save_pedigree:
+            writer = PedigreeWriter(args.save_pedigree)
+            generations = writer.tee(generations)
+        collectors = get_transmission_collectors(args)
+        transmit_genome(generations, chrom_lengths, collectors)
+        set_transmission_results(data, args, collectors)
+        passed_time = time.perf_counter() - start_time
+        print(f"Finished get_forward_population with genome transmission in {str(round(passed_time, 2))} seconds", file=sys.stderr)
+        data['runtime_stream_population_and_genome_transmission'] = passed_time
+        add_time('stream_population_and_genome_transmission', passed_time)
+        mom_time_list_per_gen, mom_time_list_per_gen_count, average_mom_time_all = mom_times['mom_time_list_per_gen'], mom_times['mom_time_list_per_gen_count'], np.average(mom_times['mom_time_all'])
+        forward_pop = None
+        if not args.save_pedigree:
+            print("Skip the genealogical ancestor, genetic ancestor and genealogical descendant analyses: they need the whole pedigree (use --save_pedigree)", file=sys.stderr)
+    else:
+        print("Compute get_forward_population", file=sys.stderr)
+        start_time = time.perf_counter()
+        forward_pop,mom_time_list_per_gen, mom_time_list_per_gen_count, average_mom_time_all = get_forward_population_gender_based_monoamorous_couples(args.pop_size, args.num_gen, chrom_lengths, args.recomb_rate, args.kappa_parameter,args.avoid_relatives, checkpoint_path=pedigree_path, checkpoint_every=args.checkpoint_every, resume=args.resume)
+        passed_time = time.perf_counter() - start_time
+        print(f"Finished get_forward_population in {str(round(passed_time, 2))} seconds", file=sys.stderr)
+        data['runtime_create_population_with_forward_method'] = passed_time
+        add_time('create_population_with_forward_method', passed_time)
     
     data["Average_time_mom_finds_a_partner_per_gen"] = mom_time_list_per_gen
     data["Number_of_moms_searched_for_a_partner_per_gen"] = mom_time_list_per_gen_count
     data["average_mom_time_all"] = average_mom_time_all
-    print("Compute get_genealogical_ancestors", file=sys.stderr)
-    start_time = time.perf_counter()
-    genealogical_ancestors, TMRCA, IAP = get_genealogical_ancestors(reversed_pop)
-
-    data['genealogical_ancestors'] = genealogical_ancestors
-    data['TMRCA'] = TMRCA
-    data['IAP'] = IAP
-    passed_time = time.perf_counter() - start_time
-    data['runtime_genealogical_ancestors'] = passed_time
-    print(f"Finished get_genealogical_ancestors in {str(round(passed_time, 2))} seconds", file=sys.stderr)
-
-    print(" get_genetic_ancestors", file=sys.stderr)
-    start_time = time.perf_counter()
-    genetic_ancestors = [float(0) for i in range(args.num_gen)]
-    for i in tqdm(range(args.num_gen), bar_format='{n_fmt}/{total_fmt} | {l_bar}{bar} | elapsed: {elapsed} - remaining: {remaining} | {rate_fmt}{postfix}'):
-        genetic_ancestors[i] = get_genetic_ancestors(i,reversed_pop, chrom_lengths)
-    data['genetic_ancestors'] = genetic_ancestors
-    passed_time = time.perf_counter() - start_time
-    data['runtime_genetic_ancestors'] = passed_time
-    print(f"Finished get_genetic_ancestors in {str(round(passed_time, 2))} seconds", file=sys.stderr)
-    
+    if args.save_pedigree:
+        if args.stream:
+            # The generations are already on disk; the analyses that need the whole pedigree read it back
+            writer.close(get_pedigree_meta(data))
+            forward_pop = PedigreeStore(args.save_pedigree)
+        else:
+            save_pedigree(args.save_pedigree, forward_pop, get_pedigree_meta(data))
+        data['pedigree_dir'] = args.save_pedigree
+    if args.resume and stage_path and os.path.exists(stage_path):
+        # Skip the analyses already done, with the random state they left
+        parameters = data
+        data = load_stage_checkpoint(stage_path)
+        if any(data.get(key) != value for key, value in parameters.items() if not key.startswith(('runtime', 'Average', 'Number', 'average'))):
+            raise ValueError(f"The checkpoint in {args.checkpoint_dir} belongs to a run with other parameters")
+        print("Resume after the analyses saved in the checkpoint", file=sys.stderr)
+    if forward_pop is not None:
+        reversed_pop = ReversedPedigree(forward_pop)
+    if forward_pop is not None and 'IAP' not in data:
+        print("Compute get_genealogical_ancestors", file=sys.stderr)
+        start_time = time.perf_counter()
+        genealogical_ancestors, TMRCA, IAP = get_genealogical_ancestors(reversed_pop)
+
+        data['genealogical_ancestors'] = genealogical_ancestors
+        data['TMRCA'] = TMRCA
+        data['IAP'] = IAP
+        passed_time = time.perf_counter() - start_time
+        data['runtime_genealogical_ancestors'] = passed_time
+        add_time('genealogical_ancestors', passed_time)
+        print(f"Finished get_genealogical_ancestors in {str(round(passed_time, 2))} seconds", file=sys.stderr)
+        checkpoint_stage(stage_path, data)
+
+    if forward_pop is not None and 'genetic_ancestors' not in data:
+        print(" get_genetic_ancestors", file=sys.stderr)
+        start_time = time.perf_counter()
+        genetic_ancestors = get_genetic_ancestors_all_depths(reversed_pop, chrom_lengths)
+        data['genetic_ancestors'] = genetic_ancestors
+        passed_time = time.perf_counter() - start_time
+        data['runtime_genetic_ancestors'] = passed_time
+        add_time('genetic_ancestors', passed_time)
+        print(f"Finished get_genetic_ancestors in {str(round(passed_time, 2))} seconds", file=sys.stderr)
+        checkpoint_stage(stage_path, data)
 
-  
-
-    # Get number of genealogical descendants
-    print("Compute get_genealogical_descendants", file=sys.stderr)
-    start_time = time.perf_counter()
-    genealogical_descendants = get_genealogical_descendants(forward_pop)
-    data['genealogical_descendants'] = genealogical_descendants
-    passed_time = time.perf_counter() - start_time
-    data['runtime_genealogical_descendants'] = passed_time
-    print(f"Finished get_genealogical_descendants in {str(round(passed_time, 2))} seconds", file=sys.stderr)
-
-        # Simulate recombinations and get number of genetic descendants, segment count, ROH frequencies and lengths
-    print("Compute get_genetic_descendants", file=sys.stderr)
-    start_time = time.perf_counter()
-    genetic_descendants, segment_count, segment_len, roh_freq, roh_len = get_genetic_descendants(forward_pop, chrom_lengths)
-    data['genetic_descendants'] = genetic_descendants
+    if forward_pop is not None and 'genealogical_descendants' not in data:
+        # Get number of genealogical descendants
+        print("Compute get_genealogical_descendants", file=sys.stderr)
+        start_time = time.perf_counter()
+        genealogical_descendants = get_genealogical_descendants(forward_pop)
+        data['genealogical_descendants'] = genealogical_descendants
+        passed_time = time.perf_counter() - start_time
+        data['runtime_genealogical_descendants'] = passed_time
+        add_time('genealogical_descendants', passed_time)
+        print(f"Finished get_genealogical_descendants in {str(round(passed_time, 2))} seconds", file=sys.stderr)
+        checkpoint_stage(stage_path, data)
+
+    if 'ibd_proportions' not in data:
+        # Simulate recombinations once and get number of genetic descendants, segment count, ROH frequencies and lengths and IBD proportions
+        print("Compute genome transmission", file=sys.stderr)
+        start_time = time.perf_counter()
+        collectors = get_transmission_collectors(args)
+        if args.chrom_workers > 0:
+            chrom_results = transmit_genome_by_chromosome(forward_pop, chrom_lengths, collectors, args.chrom_workers)
+            per_chromosome = {'genetic_descendants': [], 'segment_count': [], 'segment_len': [], 'roh_freq': [], 'roh_len': [], 'ibd_proportions': []}
+            if args.roh_bins:
+                per_chromosome['roh_len_hist'] = []
+            for descendants_result, segments_result, roh_result, ibd_result in chrom_results:
+                per_chromosome['genetic_descendants'].append(descendants_result)
+                per_chromosome['segment_count'].append(segments_result[0])
+                per_chromosome['segment_len'].append(segments_result[1])
+                per_chromosome['roh_freq'].append(roh_result[0])
+                per_chromosome['roh_len'].append(roh_result[1])
+                if args.roh_bins:
+                    per_chromosome['roh_len_hist'].append(roh_result[2])
+                per_chromosome['ibd_proportions'].append(ibd_result)
+            data['per_chromosome'] = per_chromosome
+        else:
+            transmit_genome(forward_pop, chrom_lengths, collectors)
+        set_transmission_results(data, args, collectors)
+        passed_time = time.perf_counter() - start_time
+        data['runtime_genome_transmission'] = passed_time
+        add_time('genome_transmission', passed_time)
+        print(f"Finished genome transmission in {str(round(passed_time, 2))} seconds", file=sys.stderr)
+        checkpoint_stage(stage_path, data)
+
+    return data
+
+
+def get_transmission_collectors(args: argparse.Namespace) -> list:
+    # Collectors of the genome transmission: descendants, segments, ROH, IBD and the optional IBD matrices
+    roh = RohCollector(args.roh_bins if args.roh_bins else None)
+    if args.ibd_mode == 'sampled':
+        ibd = SampledIbdCollector(args.ibd_pairs, args.seed if args.seed != 0 else None)
+    else:
+        ibd = IbdCollector(args.ibd_mode, args.workers)
+    collectors = [DescendantCollector(), SegmentCollector(), roh, ibd]
+    if args.ibd_matrix_gens:
+        ibd_matrix_gens = sorted(set(i % args.num_gen for i in args.ibd_matrix_gens))
+        collectors.append(IbdMatrixCollector(ibd_matrix_gens, args.ibd_matrix_dir, args.ibd_min_segment_len, args.ibd_block_size))
+    return collectors
+
+
+def set_transmission_results(data: dict, args: argparse.Namespace, collectors: list) -> None:
+    descendants, segments, roh, ibd = collectors[:4]
+    if args.ibd_matrix_gens:
+        ibd_matrix = collectors[4]
+        data['ibd_matrix_gens'] = sorted(ibd_matrix.generations)
+        data['ibd_matrix_dirs'] = ibd_matrix.get_result()
+        data['ibd_min_segment_len'] = args.ibd_min_segment_len
+    if args.roh_bins:
+        roh_freq, roh_len, roh_len_hist = roh.get_result()
+        data['roh_bins'] = args.roh_bins
+        data['roh_len_hist'] = roh_len_hist
+    else:
+        roh_freq, roh_len = roh.get_result()
+    segment_count, segment_len = segments.get_result()
+    data['genetic_descendants'] = descendants.get_result()
     data['segment_count'] = segment_count
     data['segment_len'] = segment_len
     data['roh_freq'] = roh_freq
     data['roh_len'] = roh_len
-    passed_time = time.perf_counter() - start_time
-    data['runtime_genetic_descendants'] = passed_time
-    print(f"Finished get_genetic_descendants in {str(round(passed_time, 2))} seconds", file=sys.stderr)
-    
-    
-    # Assuming `pop` (population data) and `chrom_lengths` are already created
-    ibd_proportions = calculate_ibd_proportion(forward_pop, chrom_lengths)
-
+    if args.ibd_mode == 'sampled':
+        ibd_proportions, ibd_proportions_se = ibd.get_result()
+        data['ibd_pairs'] = args.ibd_pairs
+        data['ibd_proportions_se'] = ibd_proportions_se
+    else:
+        ibd_proportions = ibd.get_result()
     print("IBD Proportions:", ibd_proportions)
     data['ibd_proportions'] = ibd_proportions
-    
 
-    # Print the results as JSON
-    print_json(data)
-    file_path = "/home/people/s222822/thesis/res/"
+
+def get_pedigree_meta(data: dict) -> dict:
+    # What a saved pedigree keeps of the results: the simulation parameters and the partner search times
+    keys = ('pop_size', 'num_gen', 'recomb_rate', 'seed', 'chrom_lengths', 'kappa_parameter', 'avoid_relatives',
+            'Average_time_mom_finds_a_partner_per_gen', 'Number_of_moms_searched_for_a_partner_per_gen', 'average_mom_time_all')
+    return {key: data[key] for key in keys}
+
+
+def checkpoint_stage(stage_path: str, data: dict) -> None:
+    if stage_path:
+        save_stage_checkpoint(stage_path, data)
+
+
+def write_results(data: dict, out_dir: str) -> str:
     file_current_time = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
     slurm_job_id = os.getenv("SLURM_JOB_ID", "no_job_id")
     file_name = f"results_{slurm_job_id}_job_{file_current_time}.json"
-    with open(file_path+file_name, 'w') as json_file:
+    with open(os.path.join(out_dir, file_name), 'w') as json_file:
         json.dump(data, json_file, indent=4, sort_keys=True)
+    return os.path.join(out_dir, file_name)
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    check_args(parser, args)
+    data = run(args)
+
+    # Print the results as JSON
+    print_json(data)
+    results_path = write_results(data, args.out_dir)
+    if args.instrument != 'off':
+        write_report(os.path.join(os.path.dirname(results_path), 'timing_' + os.path.basename(results_path)))
 
 
 if __name__ == '__main__':
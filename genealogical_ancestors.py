@@ -1,9 +1,42 @@
 from typing import List, Tuple
 from auxiliary_functions import new_matrix, mean_non_zero, mean_list_of_float, max_list_of_int
-from individual import Individual
+from individual import Individual, field_arrays
+from bitset import identity_bitset, row_popcount, propagate_rows
 import numpy as np
 
 def get_genealogical_ancestors(pop: List[List[Individual]]) -> Tuple[List[float], int, int]:
+    # The ancestors of all present-day individuals are propagated together, one generation at a time.
+    # Row k of bits is the set of present-day individuals having individual k of generation i as ancestor,
+    # packed as uint64 words, so the row of a parent is the OR of the rows of its children.
+    num_gen = len(pop)
+    pop_size = len(pop[0])
+
+    mean_num_ancestors = [float(0.0) for i in range(num_gen)]
+    TMRCA = -1
+    IAP = -1
+    bits = identity_bitset(pop_size)
+    for i in range(num_gen):
+        if i > 0:
+            mom_ids, dad_ids = field_arrays(pop[i - 1], ('mom_id', 'dad_id'))
+            targets = np.concatenate((mom_ids, dad_ids))
+            bits = propagate_rows(np.concatenate((bits, bits)), targets, len(pop[i]))
+
+        # Number of present-day descendants of each individual of generation i
+        num_desc_in_gen0 = row_popcount(bits)
+        total = int(num_desc_in_gen0.sum())
+        num_with_desc = int(np.count_nonzero(num_desc_in_gen0))
+
+        # Every (individual, ancestor) pair is one set bit
+        mean_num_ancestors[i] = float(total) / float(pop_size)
+        if TMRCA == -1 and int(num_desc_in_gen0.max()) == pop_size:
+            TMRCA = i
+        if IAP == -1 and int(float(total) / float(num_with_desc)) == pop_size:
+            IAP = i
+
+    return mean_num_ancestors, TMRCA, IAP
+
+
+def old_get_genealogical_ancestors(pop: List[List[Individual]]) -> Tuple[List[float], int, int]:
     num_gen = len(pop)
     pop_size = len(pop[0])
 
@@ -38,4 +71,3 @@ def get_genealogical_ancestors(pop: List[List[Individual]]) -> Tuple[List[float]
 
     return mean_num_ancestors, TMRCA, IAP
 
-
@@ -1,8 +1,52 @@
 from typing import List
+import numpy as np
 from auxiliary_functions import new_matrix, mean_non_zero
 from individual import Individual
+from generation import children_csr
+from bitset import identity_bitset, propagate_rows, unpack_bits, pack_bits, column_popcount
 
 def get_genealogical_descendants(pop: List[List[Individual]]) -> List[float]:
+    # The descendants of all founders are propagated together, one generation at a time.
+    # Row k of bits is the set of (still active) founders that individual k of generation i descends from,
+    # packed as uint64 words; each row is ORed into the rows of the children through the children CSR.
+    # A founder whose descendants are the whole generation (saturated) or nobody (extinct) keeps that
+    # count in every later generation, so its column is dropped and its count is filled in directly.
+    num_gen = len(pop)
+    pop_size = len(pop[0])
+
+    # closed[i]: every individual of generation i and after descends from the generation before it,
+    # so the descendants of a whole generation are the whole next one
+    closed = [True for i in range(num_gen + 1)]
+    for i in range(num_gen - 2, -1, -1):
+        _, child_ids = children_csr(pop[i])
+        closed[i + 1] = closed[i + 2] and len(np.unique(child_ids)) == len(pop[i + 1])
+
+    mean_num_descendants = [float(0) for i in range(num_gen)]
+    active = np.arange(pop_size)
+    saturated = np.zeros(pop_size, dtype=bool)
+    bits = identity_bitset(pop_size)
+    for i in range(num_gen):
+        if i > 0:
+            offsets, child_ids = children_csr(pop[i - 1])
+            bits = propagate_rows(np.repeat(bits, np.diff(offsets), axis=0), child_ids, len(pop[i]))
+
+        num_descendants = np.zeros(pop_size, dtype=np.int64)
+        num_descendants[saturated] = len(pop[i])
+        active_counts = column_popcount(bits, len(active))
+        num_descendants[active] = active_counts
+        mean_num_descendants[i] = mean_non_zero(num_descendants.tolist())
+
+        # Retire the saturated and the extinct founders
+        retired = (active_counts == 0) | ((active_counts == len(pop[i])) & closed[i + 1])
+        if retired.any() and i < num_gen - 1:
+            saturated[active[retired & (active_counts > 0)]] = True
+            active = active[~retired]
+            bits = pack_bits(unpack_bits(bits, len(retired))[:, ~retired])
+
+    return mean_num_descendants
+
+
+def old_get_genealogical_descendants(pop: List[List[Individual]]) -> List[float]:
     num_gen = len(pop)
     pop_size = len(pop[0])
 
@@ -25,5 +69,3 @@ def get_genealogical_descendants(pop: List[List[Individual]]) -> List[float]:
         mean_num_descendants[i] = mean_non_zero(num_descendants[i])
 
     return mean_num_descendants
-
-
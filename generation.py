@@ -0,0 +1,148 @@
+from typing import Iterator, List, Tuple
+import numpy as np
+from individual import Individual
+
+
+# Flatten a list of lists into CSR-style (offsets, values) arrays
+def to_csr(lists: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(values) for values in lists])
+    values = np.fromiter((v for values in lists for v in values), dtype=np.int64, count=int(offsets[-1]))
+    return offsets, values
+
+
+class Generation:
+    # One generation stored as contiguous arrays instead of a list of Individual objects.
+    # Children and recombination break positions are stored CSR-style:
+    # the values of individual j are values[offsets[j]:offsets[j + 1]].
+    def __init__(self, pop_size: int) -> None:
+        self.mom_id: np.ndarray = np.full(pop_size, -1, dtype=np.int64)
+        self.dad_id: np.ndarray = np.full(pop_size, -1, dtype=np.int64)
+        self.pair_id: np.ndarray = np.full(pop_size, -1, dtype=np.int64)
+        self.location: np.ndarray = np.zeros(pop_size, dtype=np.float64)
+        self.children_offsets: np.ndarray = np.zeros(pop_size + 1, dtype=np.int64)
+        self.children_ids: np.ndarray = np.empty(0, dtype=np.int64)
+        self.mom_break_offsets: np.ndarray = np.zeros(pop_size + 1, dtype=np.int64)
+        self.mom_break_pos: np.ndarray = np.empty(0, dtype=np.int64)
+        self.dad_break_offsets: np.ndarray = np.zeros(pop_size + 1, dtype=np.int64)
+        self.dad_break_pos: np.ndarray = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_individuals(cls, individuals: List[Individual]) -> "Generation":
+        gen = cls(len(individuals))
+        for j, ind in enumerate(individuals):
+            gen.mom_id[j] = ind.mom_id
+            gen.dad_id[j] = ind.dad_id
+            gen.pair_id[j] = ind.pair_id
+            gen.location[j] = ind.location
+        gen.children_offsets, gen.children_ids = to_csr([ind.children for ind in individuals])
+        gen.mom_break_offsets, gen.mom_break_pos = to_csr([ind.mom_break_pos for ind in individuals])
+        gen.dad_break_offsets, gen.dad_break_pos = to_csr([ind.dad_break_pos for ind in individuals])
+        return gen
+
+    def to_individuals(self) -> List[Individual]:
+        individuals = []
+        for view in self:
+            ind = Individual()
+            ind.mom_id, ind.dad_id, ind.pair_id, ind.location = view.mom_id, view.dad_id, view.pair_id, view.location
+            ind.children, ind.mom_break_pos, ind.dad_break_pos = view.children, view.mom_break_pos, view.dad_break_pos
+            individuals.append(ind)
+        return individuals
+
+    def set_children(self, next_gen: "Generation") -> None:
+        # Children of j are the individuals of next_gen having j as mom or dad, in index order
+        child_ids = np.arange(len(next_gen), dtype=np.int64)
+        parents = np.concatenate((next_gen.mom_id, next_gen.dad_id))
+        children = np.concatenate((child_ids, child_ids))
+        order = np.lexsort((children, parents))
+        self.children_ids = children[order]
+        self.children_offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        self.children_offsets[1:] = np.cumsum(np.bincount(parents, minlength=len(self)))
+
+    def __len__(self) -> int:
+        return len(self.mom_id)
+
+    def __getitem__(self, j: int) -> "IndividualView":
+        if j < 0:
+            j += len(self)
+        if not 0 <= j < len(self):
+            raise IndexError(f'Individual index {j} out of range for generation of size {len(self)}')
+        return IndividualView(self, j)
+
+    def __iter__(self) -> Iterator["IndividualView"]:
+        for j in range(len(self)):
+            yield IndividualView(self, j)
+
+
+# A generation as Generation, converting a list of Individual objects if needed
+def as_generation(gen: List[Individual]) -> Generation:
+    if isinstance(gen, Generation):
+        return gen
+    return Generation.from_individuals(gen)
+
+
+# Children relation of a generation as CSR (offsets, child ids): the children of individual j
+# are child_ids[offsets[j]:offsets[j + 1]], as indices into the next generation
+def children_csr(gen: List[Individual]) -> Tuple[np.ndarray, np.ndarray]:
+    if isinstance(gen, Generation):
+        return gen.children_offsets, gen.children_ids
+    return to_csr([ind.children for ind in gen])
+
+
+class IndividualView(Individual):
+    # Individual-compatible view of one row of a Generation.
+    # Scalar fields are read and written through to the generation arrays.
+    # children and break positions are read-only: they cannot be assigned, and each access returns
+    # a new list copied from the CSR arrays, so changing that list (e.g. children.append) does not
+    # change the generation. Use Generation.set_children to set the children.
+
+    def __init__(self, gen: Generation, j: int) -> None:
+        self._gen = gen
+        self._j = j
+
+    @property
+    def mom_id(self) -> int:
+        return int(self._gen.mom_id[self._j])
+
+    @mom_id.setter
+    def mom_id(self, value: int) -> None:
+        self._gen.mom_id[self._j] = value
+
+    @property
+    def dad_id(self) -> int:
+        return int(self._gen.dad_id[self._j])
+
+    @dad_id.setter
+    def dad_id(self, value: int) -> None:
+        self._gen.dad_id[self._j] = value
+
+    @property
+    def pair_id(self) -> int:
+        return int(self._gen.pair_id[self._j])
+
+    @pair_id.setter
+    def pair_id(self, value: int) -> None:
+        self._gen.pair_id[self._j] = value
+
+    @property
+    def location(self) -> float:
+        return float(self._gen.location[self._j])
+
+    @location.setter
+    def location(self, value: float) -> None:
+        self._gen.location[self._j] = value
+
+    @property
+    def children(self) -> List[int]:
+        gen = self._gen
+        return gen.children_ids[gen.children_offsets[self._j]:gen.children_offsets[self._j + 1]].tolist()
+
+    @property
+    def mom_break_pos(self) -> List[int]:
+        gen = self._gen
+        return gen.mom_break_pos[gen.mom_break_offsets[self._j]:gen.mom_break_offsets[self._j + 1]].tolist()
+
+    @property
+    def dad_break_pos(self) -> List[int]:
+        gen = self._gen
+        return gen.dad_break_pos[gen.dad_break_offsets[self._j]:gen.dad_break_offsets[self._j + 1]].tolist()
@@ -1,8 +1,9 @@
-from typing import List
-from chrom_pair import ChromPair
+from typing import List, Tuple
+from chrom_pair import ChromPair, get_generation_break_intervals
+from generation import Generation, as_generation
 from individual import Individual
 import numpy as np
-from auxiliary_functions import mean_list_of_int
+from auxiliary_functions import mean_list_of_int, sum_list_of_int
 
 
 def calculate_chromosomes_for_generation(
@@ -26,7 +27,7 @@ def get_unique_ancestors(prev_gen: List[ChromPair], pop_size: int) -> np.ndarray
    
     num_ancestors = np.zeros(pop_size, dtype=int)
     for j in range(pop_size):
-        ancestors = set(prev_gen[j].chrom_pair[0].ids + prev_gen[j].chrom_pair[1].ids)
+        ancestors = np.unique(np.concatenate((prev_gen[j].chrom_pair[0].ids, prev_gen[j].chrom_pair[1].ids)))
         num_ancestors[j] = len(ancestors)
     return num_ancestors
 
@@ -37,11 +38,7 @@ def get_genetic_ancestors(gen_minus: int, pop: List[List[Individual]], chrom_len
    
     pop_size = len(pop[0])
     # Initialize chromosome data for the initial generation
-    prev_gen = [ChromPair() for _ in range(pop_size)]
-    for j in range(pop_size):
-        for chrom_length in chrom_lengths:
-            prev_gen[j].chrom_pair[0].add_segment(j, chrom_length)
-            prev_gen[j].chrom_pair[1].add_segment(j, chrom_length)
+    prev_gen = [ChromPair.get_founder(j, chrom_lengths) for j in range(pop_size)]
 
     # Backtrack through generations to update chromosome data
     for i in range(gen_minus - 1, -1, -1):
@@ -53,3 +50,73 @@ def get_genetic_ancestors(gen_minus: int, pop: List[List[Individual]], chrom_len
     # Return the mean number of ancestors
     return mean_list_of_int(num_ancestors)
 
+
+
+def trace_pieces_to_parents(owners: np.ndarray, ancestors: np.ndarray, copies: np.ndarray, starts: np.ndarray, ends: np.ndarray, gen: Generation) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+
+    #Maps genome pieces carried by individuals of `gen` one generation back: the piece [start, end) of copy c
+    #of ancestor a comes from the parent that transmitted copy c (mom for 0, dad for 1), split by a's break intervals.
+
+    new_pieces = []
+    for copy_index, (offsets, break_pos, parent_ids) in enumerate(((gen.mom_break_offsets, gen.mom_break_pos, gen.mom_id), (gen.dad_break_offsets, gen.dad_break_pos, gen.dad_id))):
+        selected = copies == copy_index
+        piece_ancestors, piece_starts, piece_ends = ancestors[selected], starts[selected], ends[selected]
+        interval_offsets, interval_starts, interval_ends, interval_copies = get_generation_break_intervals(offsets, break_pos)
+
+        # Search all intervals at once: key = meiosis * (seq_len + 1) + position is sorted
+        stride = np.int64(interval_ends.max() + 1)
+        interval_meiosis = np.repeat(np.arange(len(offsets) - 1), np.diff(interval_offsets))
+        keys = interval_meiosis * stride + interval_ends
+        first = np.searchsorted(keys, piece_ancestors * stride + piece_starts, side='right')
+        last = np.searchsorted(keys, piece_ancestors * stride + piece_ends, side='left')
+        counts = last - first + 1
+        index = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - first, counts)
+
+        new_pieces.append((
+            np.repeat(owners[selected], counts),
+            parent_ids[np.repeat(piece_ancestors, counts)],
+            interval_copies[index],
+            np.maximum(np.repeat(piece_starts, counts), interval_starts[index]),
+            np.minimum(np.repeat(piece_ends, counts), interval_ends[index]),
+        ))
+    owners, ancestors, copies, starts, ends = (np.concatenate(arrays) for arrays in zip(*new_pieces))
+
+    # Merge overlapping or touching pieces of the same owner, ancestor and copy
+    order = np.lexsort((starts, copies, ancestors, owners))
+    owners, ancestors, copies, starts, ends = owners[order], ancestors[order], copies[order], starts[order], ends[order]
+    same_group = np.zeros(len(owners), dtype=bool)
+    same_group[1:] = (owners[1:] == owners[:-1]) & (ancestors[1:] == ancestors[:-1]) & (copies[1:] == copies[:-1])
+    group = np.cumsum(~same_group)
+    stride = np.int64(ends.max() + 1)
+    reach = np.maximum.accumulate(group * stride + ends) - group * stride
+    new_piece = ~same_group
+    new_piece[1:] |= starts[1:] > reach[:-1]
+    piece_end = np.append(new_piece[1:], True)
+    return owners[new_piece], ancestors[new_piece], copies[new_piece], starts[new_piece], reach[piece_end]
+
+
+def get_genetic_ancestors_all_depths(pop: List[List[Individual]], chrom_lengths: List[int]) -> List[float]:
+
+    #Mean number of unique genetic ancestors at every depth in one backward pass (pop[0] is the present).
+    #Element i equals get_genetic_ancestors(i, pop, chrom_lengths): instead of founding new haplotypes at
+    #every depth, the genome of every present-day individual is traced back once, one generation at a time.
+
+    num_gen = len(pop)
+    pop_size = len(pop[0])
+    seq_len = sum_list_of_int(chrom_lengths)
+
+    # Both copies of every present-day individual, as one piece each
+    owners = np.repeat(np.arange(pop_size, dtype=np.int64), 2)
+    ancestors = owners.copy()
+    copies = np.tile(np.array([0, 1], dtype=np.int64), pop_size)
+    starts = np.zeros(2 * pop_size, dtype=np.int64)
+    ends = np.full(2 * pop_size, seq_len, dtype=np.int64)
+
+    genetic_ancestors = [float(0) for i in range(num_gen)]
+    for i in range(num_gen):
+        if i > 0:
+            owners, ancestors, copies, starts, ends = trace_pieces_to_parents(owners, ancestors, copies, starts, ends, as_generation(pop[i - 1]))
+        # Unique (owner, ancestor) pairs, averaged over the present-day individuals
+        num_ancestors = len(np.unique(owners * pop_size + ancestors))
+        genetic_ancestors[i] = float(num_ancestors) / float(pop_size)
+    return genetic_ancestors
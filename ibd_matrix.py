@@ -0,0 +1,100 @@
+from typing import List
+import hashlib
+import json
+import os
+import numpy as np
+from chrom_pair import ChromPair
+
+# Pairwise IBD of one generation written to disk in row blocks:
+#   ibd_matrix.npy          N x N IBD lengths (int64), memory-mapped, filled block by block
+#   segments_block_b.npy    shared segments of block b longer than min_segment_len, one row per
+#                           segment: (j, k, chrom_index, start, end, ancestor id), with j < k
+#   progress.json           parameters, fingerprint of the generation and the blocks already written
+# A block is marked done only after its rows and segments are on disk, so an interrupted
+# run continues from the first missing block. The fingerprint (a hash of the generation index and
+# of the haplotypes) makes sure that only the same generation of the same population is continued.
+
+SEGMENT_COLUMNS = ['j', 'k', 'chrom_index', 'start', 'end', 'ancestor_id']
+
+
+def read_progress(out_dir: str) -> dict:
+    with open(os.path.join(out_dir, 'progress.json'), 'r') as file:
+        return json.load(file)
+
+
+def write_progress(out_dir: str, progress: dict) -> None:
+    path = os.path.join(out_dir, 'progress.json')
+    with open(path + '.tmp', 'w') as file:
+        json.dump(progress, file, indent=4, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def get_generation_fingerprint(curr_gen: List[ChromPair], gen_index: int = None) -> str:
+    # Hash of the generation index and of the segment ids and ends of every haplotype
+    digest = hashlib.sha256(str(gen_index).encode())
+    for ind in curr_gen:
+        for seq in ind.chrom_pair:
+            digest.update(np.int64(len(seq.ids)).tobytes())
+            digest.update(np.ascontiguousarray(seq.ids, dtype=np.int64).tobytes())
+            digest.update(np.ascontiguousarray(seq.ends, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def write_ibd_matrix(curr_gen: List[ChromPair], out_dir: str, min_segment_len: int, block_size: int = 256, gen_index: int = None) -> None:
+    pop_size = len(curr_gen)
+    num_blocks = (pop_size + block_size - 1) // block_size
+    os.makedirs(out_dir, exist_ok=True)
+    matrix_path = os.path.join(out_dir, 'ibd_matrix.npy')
+
+    progress = {'pop_size': pop_size, 'block_size': block_size, 'min_segment_len': min_segment_len,
+                'fingerprint': get_generation_fingerprint(curr_gen, gen_index), 'done_blocks': []}
+    if os.path.exists(os.path.join(out_dir, 'progress.json')) and os.path.exists(matrix_path):
+        previous = read_progress(out_dir)
+        if any(previous.get(key) != progress[key] for key in ('pop_size', 'block_size', 'min_segment_len')):
+            raise ValueError(f"{out_dir} holds an IBD matrix computed with other parameters: {previous}")
+        if previous.get('fingerprint') != progress['fingerprint']:
+            raise ValueError(f"{out_dir} holds the IBD matrix of another generation or population; use another directory or remove it")
+        progress = previous
+        matrix = np.lib.format.open_memmap(matrix_path, mode='r+')
+    else:
+        matrix = np.lib.format.open_memmap(matrix_path, mode='w+', dtype=np.int64, shape=(pop_size, pop_size))
+        write_progress(out_dir, progress)
+
+    seq_len = curr_gen[0].chrom_pair[0].seq_len
+    done_blocks = set(progress['done_blocks'])
+    for block in range(num_blocks):
+        if block in done_blocks:
+            continue
+        row_start, row_end = block * block_size, min((block + 1) * block_size, pop_size)
+        rows = np.zeros((row_end - row_start, pop_size), dtype=np.int64)
+        long_segments = []
+        for j in range(row_start, row_end):
+            # Both copies are shared completely with oneself
+            rows[j - row_start, j] = 2 * seq_len
+            for k in range(j + 1, pop_size):
+                segments = curr_gen[j].get_ibd_segments(curr_gen[k])
+                rows[j - row_start, k] = sum(end - start for _, start, end, _ in segments)
+                long_segments.extend((j, k) + segment for segment in segments if segment[2] - segment[1] >= min_segment_len)
+
+        # Upper triangle of the block rows (completed to symmetric inside the block's own square),
+        # and its mirror in the columns of the block
+        square = rows[:, row_start:row_end]
+        rows[:, row_start:row_end] = np.triu(square) + np.triu(square, 1).T
+        matrix[row_start:row_end, row_start:] = rows[:, row_start:]
+        matrix[row_start:, row_start:row_end] = rows[:, row_start:].T
+        matrix.flush()
+        segment_table = np.array(long_segments, dtype=np.int64).reshape(-1, len(SEGMENT_COLUMNS))
+        np.save(os.path.join(out_dir, f'segments_block_{block}.npy'), segment_table)
+
+        progress['done_blocks'].append(block)
+        write_progress(out_dir, progress)
+    del matrix
+
+
+def load_ibd_segments(out_dir: str) -> np.ndarray:
+    # All long shared segments of a written generation as one table (columns SEGMENT_COLUMNS)
+    progress = read_progress(out_dir)
+    tables = [np.load(os.path.join(out_dir, f'segments_block_{block}.npy')) for block in sorted(progress['done_blocks'])]
+    if len(tables) == 0:
+        return np.empty((0, len(SEGMENT_COLUMNS)), dtype=np.int64)
+    return np.concatenate(tables)
@@ -3,12 +3,21 @@ from typing import List, Tuple
 import math
 import random
 import numpy as np
-import sympy as sp
 import sys
-import matplotlib.pyplot as plt
 import time 
 from datetime import datetime
-from scipy.stats import vonmises
+
+# Element type of the fields of an individual when stored as arrays (as in Generation)
+FIELD_DTYPES = {'mom_id': np.int64, 'dad_id': np.int64, 'pair_id': np.int64, 'location': np.float64}
+
+
+# The given fields of a whole generation as contiguous arrays, one per field
+def field_arrays(gen: List["Individual"], fields: Tuple[str, ...]) -> Tuple[np.ndarray, ...]:
+    if not isinstance(gen, list):
+        # Generation already stores them as arrays
+        return tuple(getattr(gen, name) for name in fields)
+    return tuple(np.fromiter((getattr(ind, name) for ind in gen), dtype=FIELD_DTYPES[name], count=len(gen)) for name in fields)
+
 
 class Individual:
     def __init__(self,location_degrees=None) -> None:
@@ -37,7 +46,7 @@ class Individual:
         else:
             start, end = loc2, loc2 + counterclockwise_dist
         # Generate a location uniformly between start and end
-        other_locations=[ind.location for ind in current_gen  ]
+        other_locations={ind.location for ind in current_gen}
         child_location=None
         count=0
         while count<tries:
@@ -53,7 +62,7 @@ class Individual:
     @staticmethod
     def uniform_location_on_circle(mom_ind, dad_ind, current_gen, tries=1000):
 
-        other_locations=[ind.location for ind in current_gen  ]
+        other_locations={ind.location for ind in current_gen}
         child_location=None
         count=0
         while count<tries:
@@ -72,6 +81,8 @@ class Individual:
         return 'ipykernel' in sys.modules or 'jupyter_client' in sys.modules
     @staticmethod
     def _radians_to_fraction(rads: float) -> str:
+        # sympy is only needed for printing locations, so it is imported here rather than with the module
+        import sympy as sp
 
         radians = rads % (2 * np.pi)
 
@@ -175,7 +186,56 @@ class Individual:
 
         return len(shared_grandparents) > 0
 
-    def find_single_male_partner(self, mu: float, pop_size: int, previous_gen: List["Individual"], preprevious_gen: List["Individual"], kappa_parameter: int,avoid_relatives: str=None) -> int:
+    @staticmethod
+    def circular_distances(location: float, locations: np.ndarray) -> np.ndarray:
+        # Same shortest-arc distance as distance_between, for many individuals at once
+        distances = np.abs(locations - location)
+        return np.where(distances > np.pi, 2 * np.pi - distances, distances)
+
+    @staticmethod
+    def von_mises_weights(distances: np.ndarray, kappa_parameter: float, mu: float = 0) -> np.ndarray:
+        # Unnormalized von Mises weights exp(kappa * cos(d - mu)).
+        # The constant 1/(2*pi*I0(kappa)) of vonmises.pdf cancels after normalization,
+        # and shifting the exponent by its maximum keeps large kappa from underflowing.
+        exponent = kappa_parameter * np.cos(distances - mu)
+        return np.exp(exponent - exponent.max())
+
+    def find_single_male_partner(self, mu: float, pop_size: int, previous_gen: List["Individual"], preprevious_gen: List["Individual"], kappa_parameter: int,avoid_relatives: str=None, kinship=None) -> int:
+        # kinship: optional KinshipIndex of previous_gen, replaces the per-male is_sibling/is_cousin calls
+        if avoid_relatives not in (None, '', 'siblings', 'cousins', 'siblingscousins'):
+            raise ValueError(f'Invalid avoid_relatives value : {avoid_relatives}')
+
+        # Step 1: Filter only unpaired fathers with one array operation
+        locations, pair_ids = field_arrays(previous_gen, ('location', 'pair_id'))
+        first_male = math.floor(pop_size / 2)
+        male_indices = first_male + np.flatnonzero(pair_ids[first_male:pop_size] == -1)
+
+        # Exclude siblings and cousins
+        if avoid_relatives and kinship is not None:
+            male_indices = male_indices[~kinship.get_relatives_mask(self, avoid_relatives)[male_indices]]
+        elif avoid_relatives in ('siblings', 'siblingscousins'):
+            keep = np.fromiter((not self.is_sibling(previous_gen[i]) for i in male_indices), dtype=bool, count=len(male_indices))
+            male_indices = male_indices[keep]
+        if avoid_relatives in ('cousins', 'siblingscousins') and kinship is None:
+            keep = np.fromiter((not self.is_cousin(previous_gen[i], preprevious_gen) for i in male_indices), dtype=bool, count=len(male_indices))
+            male_indices = male_indices[keep]
+
+        # Step 2: Handle the case of no available mates gracefully
+        if len(male_indices) == 0:
+            return -9  # Return a signal for no available partner
+
+        # Step 3: Distances from the mother to each unpaired father
+        distances = Individual.circular_distances(self.location, locations[male_indices])
+
+        # Step 4: Weights using von Mises distribution, normalized to probabilities
+        center_mu = 0 if mu is None else mu
+        weights = Individual.von_mises_weights(distances, kappa_parameter, center_mu)
+
+        # Step 5: Select a father based on the normalized weights
+        selected_index = np.random.choice(male_indices, p=weights / weights.sum())
+
+        return int(selected_index)
+    def old3_find_single_male_partner(self, mu: float, pop_size: int, previous_gen: List["Individual"], preprevious_gen: List["Individual"], kappa_parameter: int,avoid_relatives: str=None) -> int:
         # Step 1: Filter only unpaired fathers (and exclude siblings and cousins)
         if avoid_relatives is None:
             single_males = [
@@ -229,6 +289,7 @@ class Individual:
 
         # Step 5: Calculate weights using von Mises distribution
         center_mu = 0 if mu is None else mu
+        from scipy.stats import vonmises
         weights = [vonmises.pdf(dist, kappa=kappa_parameter, loc=center_mu) for dist in distances]
 
         # Step 6: Normalize weights to make them probabilities
@@ -260,6 +321,7 @@ class Individual:
     
     # Step 5: Calculate weights using von Mises distribution
         center_mu = 0 if mu is None else mu
+        from scipy.stats import vonmises
         weights = [vonmises.pdf(dist, kappa=kappa_parameter, loc=center_mu) for dist in distances]
 
     # Step 6: Normalize weights to make them probabilities
@@ -361,6 +423,7 @@ class Individual:
 
     # Step 5: Calculate weights using von Mises distribution centered on the mother's location (`mu`)
         center_mu = 0 if mu is None else mu
+        from scipy.stats import vonmises
         weights = [vonmises.pdf(dist, kappa=kappa_parameter, loc=center_mu) for dist in distances]
 
     # Step 6: Normalize weights to make them probabilities
@@ -395,7 +458,7 @@ class Individual:
                 if random.randint(0, 1) == 1:
                     break_pos.append(chrom_break_pos[j])
             
-            num_recomb = np.random.default_rng().binomial(seq_len, recomb_rate)
+            num_recomb = np.random.binomial(seq_len, recomb_rate)
             for j in range(num_recomb):
                 break_pos.append(random.randint(1, seq_len - 2))
 
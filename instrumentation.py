@@ -0,0 +1,118 @@
+from typing import Dict, List
+import json
+import time
+
+# Timings and counters of a run, collected in this process and written as a JSON timing report.
+# Levels:
+#   off         nothing is recorded (timer() returns a shared no-op context, count() returns at once)
+#   stage       totals of the stages of forward.py and of every phase and counter over all generations
+#   generation  also the value of every phase and counter in every generation
+# Phases and counters recorded with a generation index are per-generation ones; without one they
+# are stages. The simulation and the transmission record different names, so they can interleave
+# (as with forward.py --stream).
+
+LEVELS = ('off', 'stage', 'generation')
+
+
+class Instrumentation:
+    def __init__(self) -> None:
+        self.level = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.per_generation: Dict[str, Dict[int, float]] = {}
+
+    def add(self, totals: dict, name: str, value, gen_index: int) -> None:
+        totals[name] = totals.get(name, 0) + value
+        if gen_index is not None and self.level >= 2:
+            values = self.per_generation.setdefault(name, {})
+            values[gen_index] = values.get(gen_index, 0) + value
+
+
+current = Instrumentation()
+
+
+class Timer:
+    # Adds the time spent inside the with block to phase name
+    __slots__ = ('name', 'gen_index', 'start_time')
+
+    def __init__(self, name: str, gen_index: int) -> None:
+        self.name = name
+        self.gen_index = gen_index
+
+    def __enter__(self) -> "Timer":
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        add_time(self.name, time.perf_counter() - self.start_time, self.gen_index)
+        return False
+
+
+class NoTimer:
+    def __enter__(self) -> "NoTimer":
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+NO_TIMER = NoTimer()
+
+
+def set_level(level: str) -> None:
+    if level not in LEVELS:
+        raise ValueError(f"Unknown instrumentation level '{level}'. Possible values: {', '.join(LEVELS)}")
+    current.level = LEVELS.index(level)
+
+
+def is_enabled(level: str = 'stage') -> bool:
+    return current.level >= LEVELS.index(level)
+
+
+def reset() -> None:
+    current.reset()
+
+
+def timer(name: str, gen_index: int = None):
+    if current.level == 0:
+        return NO_TIMER
+    return Timer(name, gen_index)
+
+
+def add_time(name: str, seconds: float, gen_index: int = None) -> None:
+    if current.level == 0:
+        return
+    current.add(current.seconds, name, seconds, gen_index)
+    current.calls[name] = current.calls.get(name, 0) + 1
+
+
+def count(name: str, n: int = 1, gen_index: int = None) -> None:
+    if current.level == 0:
+        return
+    current.add(current.counters, name, n, gen_index)
+
+
+def get_report() -> dict:
+    # Totals, and with level 'generation' one list per phase or counter indexed by generation
+    # (None for the generations where it was not recorded)
+    report = {
+        'level': LEVELS[current.level],
+        'seconds': dict(current.seconds),
+        'calls': dict(current.calls),
+        'counters': dict(current.counters),
+    }
+    if current.level >= 2:
+        per_generation: Dict[str, List[float]] = {}
+        for name, values in current.per_generation.items():
+            per_generation[name] = [values.get(i) for i in range(max(values) + 1)]
+        report['per_generation'] = per_generation
+    return report
+
+
+def write_report(path: str) -> None:
+    with open(path, 'w') as json_file:
+        json.dump(get_report(), json_file, indent=4, sort_keys=True)
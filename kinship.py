@@ -0,0 +1,61 @@
+from typing import List, Tuple
+import numpy as np
+from individual import Individual, field_arrays
+
+
+class MemberIndex:
+    # Sparse key -> members relation (e.g. parent id -> children), sorted by key.
+    # Keys equal to -1 ("no ancestor") are dropped.
+    def __init__(self, keys: np.ndarray, members: np.ndarray) -> None:
+        valid = keys != -1
+        order = np.argsort(keys[valid], kind='stable')
+        self.keys: np.ndarray = keys[valid][order]
+        self.members: np.ndarray = members[valid][order]
+
+    def get_members(self, key: int) -> np.ndarray:
+        start = np.searchsorted(self.keys, key, side='left')
+        end = np.searchsorted(self.keys, key, side='right')
+        return self.members[start:end]
+
+
+class KinshipIndex:
+    # Relatedness index of one generation, built once from the parent ids of the generation
+    # and of the generation before it. It answers the same questions as Individual.is_sibling
+    # and Individual.is_cousin for all members of the generation with a few index lookups.
+    def __init__(self, gen: List[Individual], previous_gen: List[Individual]) -> None:
+        mom_ids, dad_ids = field_arrays(gen, ('mom_id', 'dad_id'))
+        self.pop_size = len(mom_ids)
+        members = np.arange(self.pop_size, dtype=np.int64)
+        self.by_mom = MemberIndex(mom_ids, members)
+        self.by_dad = MemberIndex(dad_ids, members)
+
+        self.grandparent_mom_ids = None
+        self.grandparent_dad_ids = None
+        self.by_grandparent = None
+        if previous_gen is not None:
+            self.grandparent_mom_ids, self.grandparent_dad_ids = field_arrays(previous_gen, ('mom_id', 'dad_id'))
+            # is_cousin is False as soon as one of the parents is unknown
+            with_parents = members[(mom_ids != -1) & (dad_ids != -1)]
+            grandparents = np.stack((
+                self.grandparent_mom_ids[mom_ids[with_parents]], self.grandparent_dad_ids[mom_ids[with_parents]],
+                self.grandparent_mom_ids[dad_ids[with_parents]], self.grandparent_dad_ids[dad_ids[with_parents]],
+            ), axis=1)
+            self.by_grandparent = MemberIndex(grandparents.ravel(), np.repeat(with_parents, 4))
+
+    def get_relatives_mask(self, ind: Individual, avoid_relatives: str) -> np.ndarray:
+        # True for every member of the generation that `ind` must not pair with
+        mask = np.zeros(self.pop_size, dtype=bool)
+        if avoid_relatives in ('siblings', 'siblingscousins'):
+            if ind.mom_id != -1:
+                mask[self.by_mom.get_members(ind.mom_id)] = True
+            if ind.dad_id != -1:
+                mask[self.by_dad.get_members(ind.dad_id)] = True
+        if avoid_relatives in ('cousins', 'siblingscousins') and self.by_grandparent is not None:
+            if ind.mom_id != -1 and ind.dad_id != -1:
+                grandparents = {
+                    int(self.grandparent_mom_ids[ind.mom_id]), int(self.grandparent_dad_ids[ind.mom_id]),
+                    int(self.grandparent_mom_ids[ind.dad_id]), int(self.grandparent_dad_ids[ind.dad_id]),
+                } - {-1}
+                for grandparent in grandparents:
+                    mask[self.by_grandparent.get_members(grandparent)] = True
+        return mask
@@ -0,0 +1,49 @@
+from typing import Iterable
+import numpy as np
+
+
+class LocationAllocator:
+    # Locations already taken in one generation, kept as a sorted array so that collision
+    # checks for a whole batch of draws are one searchsorted instead of a scan per individual.
+    # Every individual gets at most `tries` draws, as in Individual.uniform_location_on_circle.
+    # num_redraws counts the draws repeated after a collision.
+    def __init__(self, occupied: Iterable[float] = ()) -> None:
+        self.occupied: np.ndarray = np.unique(np.fromiter(occupied, dtype=np.float64))
+        self.num_redraws: int = 0
+
+    def _is_occupied(self, locations: np.ndarray) -> np.ndarray:
+        index = np.searchsorted(self.occupied, locations)
+        found = np.zeros(np.shape(locations), dtype=bool)
+        inside = index < len(self.occupied)
+        found[inside] = self.occupied[index[inside]] == np.asarray(locations)[inside]
+        return found
+
+    def _accept(self, locations: np.ndarray, pending: np.ndarray) -> np.ndarray:
+        # Accepts the pending draws that collide neither with an occupied location nor with
+        # an earlier draw of the same batch, and returns the ones that must be drawn again
+        draws = locations[pending]
+        _, first = np.unique(draws, return_index=True)
+        accepted = np.zeros(len(pending), dtype=bool)
+        accepted[first] = True
+        accepted &= ~self._is_occupied(draws)
+        self.occupied = np.sort(np.concatenate((self.occupied, draws[accepted])))
+        return pending[~accepted]
+
+    def draw_uniform_on_circle(self, n: int, tries: int = 1000) -> np.ndarray:
+        # n distinct locations drawn uniformly on the whole circle
+        return self.draw_uniform_between(np.zeros(n), np.full(n, 2 * np.pi), tries)
+
+    def draw_uniform_between(self, starts: np.ndarray, ends: np.ndarray, tries: int = 1000) -> np.ndarray:
+        # One distinct location per arc, drawn uniformly between starts[j] and ends[j] (taken modulo 2*pi)
+        locations = np.zeros(len(starts), dtype=np.float64)
+        pending = np.arange(len(starts), dtype=np.int64)
+        count = 0
+        while count < tries and len(pending) > 0:
+            if count > 0:
+                self.num_redraws += len(pending)
+            count += 1
+            locations[pending] = np.random.uniform(starts[pending], ends[pending]) % (2 * np.pi)
+            pending = self._accept(locations, pending)
+        if len(pending) > 0:
+            raise ValueError(f"No valid location found for {len(pending)} individuals after {tries} tries.")
+        return locations
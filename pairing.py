@@ -0,0 +1,46 @@
+import math
+import time
+from typing import List, Tuple
+import numpy as np
+from individual import Individual
+from kinship import KinshipIndex
+
+
+def form_couples(pop_size: int, previous_gen: List[Individual], preprevious_gen: List[Individual], kappa_parameter: int, avoid_relatives: str=None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Pair the whole previous generation (which arrives unpaired) in one pass over the females, visited
+    # in random order. Every female picks a free male with find_single_male_partner (same von Mises
+    # preference and avoid_relatives rules); females with no available male (-9) stay single.
+    # pair_id is set for every couple formed, also for those that get no children (the per-child
+    # pairing only paired the moms that a child picked), and is saved with the pedigree.
+    # Returns the moms and dads of the couples and the time each mom needed to find her partner,
+    # rounded like set_parents_straight_monoamorous_couple.
+    moms = []
+    dads = []
+    mom_times = []
+    # Sibling and cousin relations are indexed once for the whole generation
+    kinship = KinshipIndex(previous_gen, preprevious_gen) if avoid_relatives else None
+    for mom_id in np.random.permutation(math.floor(pop_size / 2)):
+        mom_id = int(mom_id)
+        start_time = time.perf_counter()
+        dad_id = previous_gen[mom_id].find_single_male_partner(None, pop_size, previous_gen, preprevious_gen, kappa_parameter, avoid_relatives, kinship)
+        if dad_id == -9:
+            continue
+
+        previous_gen[mom_id].pair_id = dad_id
+        previous_gen[dad_id].pair_id = mom_id
+        moms.append(mom_id)
+        dads.append(dad_id)
+        mom_times.append(round(time.perf_counter() - start_time, 2))
+
+    if len(moms) == 0:
+        raise ValueError('No couple could be formed in this generation: either all moms couldnt find a free partner or all moms are sisters or cousins with all men.(a very extreme case)')
+
+    return np.array(moms, dtype=np.int64), np.array(dads, dtype=np.int64), np.array(mom_times, dtype=np.float64)
+
+
+def assign_children_to_couples(pop_size: int, moms: np.ndarray, dads: np.ndarray, mom_times: np.ndarray) -> Tuple[np.ndarray, np.ndarray, List[float]]:
+    # Every child picks a couple uniformly at random, as a child picking a random (pairable) mom did.
+    # Only couples that got at least one child are reported in the waiting times,
+    # matching the moms that searched for a partner in the per-child pairing.
+    couple = np.random.randint(0, len(moms), size=pop_size)
+    return moms[couple], dads[couple], mom_times[np.unique(couple)].tolist()
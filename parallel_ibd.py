@@ -0,0 +1,90 @@
+from typing import Dict, List, Tuple
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from auxiliary_functions import get_pool_context
+from chrom_pair import ChromPair, get_sequence_ibd_length
+
+# Parallel all-pairs IBD length of one generation.
+# The haplotypes are published once per generation in one shared memory block of int64 values:
+#   offsets (2 * pop_size + 1) | ids (num_segments) | ends (num_segments)
+# where sequence 2 * j + c (copy c of individual j) is ids/ends[offsets[2 * j + c]:offsets[2 * j + c + 1]].
+# Workers attach to the block and sum the IBD length of the pairs j < k of square tiles of (j, k),
+# so no ChromPair is ever pickled. Tile sums are integers, so the total equals the serial one.
+
+# Shared memory blocks attached by this worker process, by name
+attached_blocks: Dict[str, Tuple[shared_memory.SharedMemory, np.ndarray]] = {}
+
+
+def attach_block(name: str, size: int) -> np.ndarray:
+    if name not in attached_blocks:
+        # Drop the blocks of previous generations
+        for shm, _ in attached_blocks.values():
+            shm.close()
+        attached_blocks.clear()
+        shm = shared_memory.SharedMemory(name=name)
+        attached_blocks[name] = (shm, np.ndarray((size,), dtype=np.int64, buffer=shm.buf))
+    return attached_blocks[name][1]
+
+
+def get_tile_ibd_length(task: Tuple[str, int, int, int, int, int, int]) -> int:
+    name, pop_size, num_segments, row_start, row_end, col_start, col_end = task
+    block = attach_block(name, 2 * pop_size + 1 + 2 * num_segments)
+    offsets = block[:2 * pop_size + 1]
+    ids = block[2 * pop_size + 1:2 * pop_size + 1 + num_segments]
+    ends = block[2 * pop_size + 1 + num_segments:]
+
+    # Segments of every sequence of the tile as lists, converted once
+    def get_sequences(start: int, end: int) -> List[Tuple[List[int], List[int]]]:
+        return [(ids[offsets[s]:offsets[s + 1]].tolist(), ends[offsets[s]:offsets[s + 1]].tolist()) for s in range(2 * start, 2 * end)]
+
+    rows = get_sequences(row_start, row_end)
+    cols = rows if col_start == row_start else get_sequences(col_start, col_end)
+    ibd_length = 0
+    for j in range(row_start, row_end):
+        for k in range(max(j + 1, col_start), col_end):
+            for c in range(2):
+                my_ids, my_ends = rows[2 * (j - row_start) + c]
+                other_ids, other_ends = cols[2 * (k - col_start) + c]
+                ibd_length += get_sequence_ibd_length(my_ids, my_ends, other_ids, other_ends)
+    return ibd_length
+
+
+class ParallelIbd:
+    # Pool of worker processes computing the total pairwise IBD length of a generation.
+    # The pool is kept for the whole run; close() stops it.
+    def __init__(self, workers: int, tile_size: int = 64) -> None:
+        self.workers = workers
+        self.tile_size = tile_size
+        # Workers must share the resource tracker of this process (which owns and unlinks the blocks),
+        # otherwise each one starts its own tracker that tries to unlink the blocks again on exit
+        resource_tracker.ensure_running()
+        self.pool = get_pool_context().Pool(workers)
+
+    def get_total_ibd_length(self, curr_gen: List[ChromPair]) -> int:
+        pop_size = len(curr_gen)
+        seqs = [ind.chrom_pair[c] for ind in curr_gen for c in range(2)]
+        offsets = np.zeros(2 * pop_size + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(seq.ids) for seq in seqs])
+        num_segments = int(offsets[-1])
+
+        shm = shared_memory.SharedMemory(create=True, size=8 * (2 * pop_size + 1 + 2 * num_segments))
+        try:
+            block = np.ndarray((2 * pop_size + 1 + 2 * num_segments,), dtype=np.int64, buffer=shm.buf)
+            block[:2 * pop_size + 1] = offsets
+            block[2 * pop_size + 1:2 * pop_size + 1 + num_segments] = np.concatenate([seq.ids for seq in seqs])
+            block[2 * pop_size + 1 + num_segments:] = np.concatenate([seq.ends for seq in seqs])
+            del block
+
+            # Tiles of the upper triangle of the pair matrix
+            tasks = []
+            for row_start in range(0, pop_size, self.tile_size):
+                for col_start in range(row_start, pop_size, self.tile_size):
+                    tasks.append((shm.name, pop_size, num_segments, row_start, min(row_start + self.tile_size, pop_size), col_start, min(col_start + self.tile_size, pop_size)))
+            return sum(self.pool.imap_unordered(get_tile_ibd_length, tasks))
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def close(self) -> None:
+        self.pool.close()
+        self.pool.join()
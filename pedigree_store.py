@@ -0,0 +1,132 @@
+from typing import Iterable, Iterator, List
+import json
+import os
+import numpy as np
+from generation import Generation
+
+# Binary pedigree store: a directory with one .npy file per array of every generation,
+#   gen{i}_{name}.npy   name in GENERATION_ARRAYS (mom/dad/pair ids, locations, CSR children and CSR break positions)
+#   meta.json           number of generations, population size, chromosome lengths and the simulation results
+#                       that are not in the arrays (parameters, partner search times)
+# meta.json is written last, so a store without it is incomplete.
+# PedigreeStore opens the arrays memory-mapped, one generation at a time, so the analyses can run
+# on a saved population (in the place of the list of generations) without loading it into RAM.
+
+GENERATION_ARRAYS = ['mom_id', 'dad_id', 'pair_id', 'location', 'children_offsets', 'children_ids',
+                     'mom_break_offsets', 'mom_break_pos', 'dad_break_offsets', 'dad_break_pos']
+
+
+def save_generation(out_dir: str, i: int, gen: Generation) -> None:
+    # Every array is written to a temporary file and then renamed, so a file is either the old or the new one
+    for name in GENERATION_ARRAYS:
+        path = os.path.join(out_dir, f'gen{i}_{name}.npy')
+        with open(path + '.tmp', 'wb') as file:
+            np.save(file, getattr(gen, name))
+        os.replace(path + '.tmp', path)
+
+
+def load_generation(path: str, i: int, mmap_mode: str = None) -> Generation:
+    gen = Generation(0)
+    for name in GENERATION_ARRAYS:
+        setattr(gen, name, np.load(os.path.join(path, f'gen{i}_{name}.npy'), mmap_mode=mmap_mode))
+    return gen
+
+
+class PedigreeWriter:
+    # Writes the generations one by one, in order; close() completes the store
+    def __init__(self, out_dir: str) -> None:
+        self.out_dir = out_dir
+        self.num_gen = 0
+        self.pop_size = 0
+        os.makedirs(out_dir, exist_ok=True)
+        # An old meta.json would make a partly overwritten store look complete
+        if os.path.exists(os.path.join(out_dir, 'meta.json')):
+            os.remove(os.path.join(out_dir, 'meta.json'))
+
+    def append(self, gen: Generation) -> None:
+        # The children of a generation are known only once the next one exists, so
+        # a generation is appended after its children have been set
+        save_generation(self.out_dir, self.num_gen, gen)
+        self.pop_size = len(gen)
+        self.num_gen += 1
+
+    def tee(self, generations: Iterable[Generation]) -> Iterator[Generation]:
+        # Passes a stream of generations through, appending every generation on the way
+        for gen in generations:
+            self.append(gen)
+            yield gen
+
+    def close(self, meta: dict = None) -> None:
+        meta = dict(meta if meta is not None else {}, num_gen=self.num_gen, pop_size=self.pop_size)
+        path = os.path.join(self.out_dir, 'meta.json')
+        with open(path + '.tmp', 'w') as file:
+            json.dump(meta, file, indent=4, sort_keys=True)
+        os.replace(path + '.tmp', path)
+
+
+def save_pedigree(out_dir: str, pop: List[Generation], meta: dict = None) -> None:
+    writer = PedigreeWriter(out_dir)
+    for gen in pop:
+        writer.append(gen)
+    writer.close(meta)
+
+
+class PedigreeStore:
+    # Read-only sequence of the generations of a saved pedigree (pop[0] is the founder generation).
+    # Generations are opened on access; the most recently used ones are kept open, since the
+    # analyses read the same generation many times in a row.
+    def __init__(self, path: str, mmap_mode: str = 'r', cache_size: int = 3) -> None:
+        meta_path = os.path.join(path, 'meta.json')
+        if not os.path.exists(meta_path):
+            raise ValueError(f"{path} is not a complete pedigree store (no meta.json)")
+        with open(meta_path, 'r') as file:
+            self.meta: dict = json.load(file)
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.cache_size = cache_size
+        self.cache: List[tuple] = []
+
+    def __len__(self) -> int:
+        return self.meta['num_gen']
+
+    def __getitem__(self, i: int) -> Generation:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f'Generation index {i} out of range for pedigree of {len(self)} generations')
+        for cached_i, gen in self.cache:
+            if cached_i == i:
+                return gen
+        gen = load_generation(self.path, i, self.mmap_mode)
+        self.cache.append((i, gen))
+        if len(self.cache) > self.cache_size:
+            self.cache.pop(0)
+        return gen
+
+    def __iter__(self) -> Iterator[Generation]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __reversed__(self) -> Iterator[Generation]:
+        for i in reversed(range(len(self))):
+            yield self[i]
+
+
+class ReversedPedigree:
+    # The generations of a pedigree (a list or a PedigreeStore) from the last to the first, so that
+    # pop[0] is the present as the backward analyses expect, without materializing a reversed list
+    def __init__(self, pop: List[Generation]) -> None:
+        self.pop = pop
+
+    def __len__(self) -> int:
+        return len(self.pop)
+
+    def __getitem__(self, i: int) -> Generation:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f'Generation index {i} out of range for pedigree of {len(self.pop)} generations')
+        return self.pop[len(self.pop) - 1 - i]
+
+    def __iter__(self) -> Iterator[Generation]:
+        return reversed(self.pop)
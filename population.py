@@ -1,10 +1,15 @@
 import numpy as np
-from typing import List
+from typing import Dict, Iterator, List, Tuple
 from individual import Individual
+from generation import Generation
+from pairing import form_couples, assign_children_to_couples
+from location_allocator import LocationAllocator
+from recombination import draw_generation_break_pos
 from chrom_break_pos import get_chrom_break_pos
-from scipy.stats import vonmises
+from instrumentation import timer, count
+from checkpoint import get_random_state, set_random_state, PedigreeCheckpoint
 
-def get_backward_population(pop_size: int, num_gen: int, chrom_lengths: List[int], recomb_rate: float) -> List[List[Individual]]:
+def get_backward_population(pop_size: int, num_gen: int, chrom_lengths: List[int], recomb_rate: float) -> List[Generation]:
     chrom_break_pos = get_chrom_break_pos(chrom_lengths)
     pop = [[] for i in range(num_gen)]
 
@@ -17,9 +22,9 @@ def get_backward_population(pop_size: int, num_gen: int, chrom_lengths: List[int
     for j in range(pop_size):
         pop[num_gen-1].append(Individual())
 
-    return pop
+    return [Generation.from_individuals(gen) for gen in pop]
 
-def get_forward_population(pop_size: int, num_gen: int, chrom_lengths: List[int], recomb_rate: float) -> List[List[Individual]]:
+def get_forward_population(pop_size: int, num_gen: int, chrom_lengths: List[int], recomb_rate: float) -> List[Generation]:
     chrom_break_pos = get_chrom_break_pos(chrom_lengths)
     pop = [[] for i in range(num_gen)]
 
@@ -34,10 +39,71 @@ def get_forward_population(pop_size: int, num_gen: int, chrom_lengths: List[int]
             pop[i - 1][mom_id].children.append(j)
             pop[i - 1][dad_id].children.append(j)
 
-    return pop
-
-def get_forward_population_gender_based_monoamorous_couples(pop_size: int, num_gen: int, chrom_lengths: List[int], recomb_rate: float, kappa_parameter: int, avoid_relatives: str=None) -> List[List[Individual]]:
+    return [Generation.from_individuals(gen) for gen in pop]
+
+def get_next_couples_generation(i: int, pop_size: int, prev_gen: Generation, prev_prev_gen: Generation, chrom_break_pos: List[int], recomb_rate: float, kappa_parameter: int, avoid_relatives: str, rng: np.random.Generator) -> Tuple[Generation, List[float]]:
+    # Generation i from generations i-1 and i-2 (None for i = 1); also sets the children of generation i-1.
+    # Returns the generation and the partner search times of its moms.
+    # Form all couples of generation i-1 at once, then let every child draw its couple
+    with timer('pairing', i):
+        moms, dads, mom_times = form_couples(pop_size, prev_gen, prev_prev_gen, kappa_parameter, avoid_relatives)
+    count('new_couples', int(np.sum(mom_times > -1)), i)
+    # Moms whose partner search found no available male
+    count('mate_search_failures', pop_size // 2 - len(moms), i)
+    with timer('child_assignment', i):
+        mom_ids, dad_ids, mom_time_list_curr_gen = assign_children_to_couples(pop_size, moms, dads, mom_times)
+
+    gen = Generation(pop_size)
+    gen.mom_id, gen.dad_id = mom_ids, dad_ids
+    # Distinct locations for the whole generation in one batch
+    with timer('location_sampling', i):
+        allocator = LocationAllocator()
+        gen.location = allocator.draw_uniform_on_circle(pop_size)
+    count('location_redraws', allocator.num_redraws, i)
+    # Break positions of all 2 * pop_size meioses at once
+    with timer('break_pos_drawing', i):
+        gen.mom_break_offsets, gen.mom_break_pos, gen.dad_break_offsets, gen.dad_break_pos = draw_generation_break_pos(rng, pop_size, chrom_break_pos, recomb_rate)
+    count('break_pos', len(gen.mom_break_pos) + len(gen.dad_break_pos), i)
+    with timer('set_children', i):
+        prev_gen.set_children(gen)
+    return gen, mom_time_list_curr_gen
+
+
+def iterate_forward_population_gender_based_monoamorous_couples(pop_size: int, num_gen: int, chrom_lengths: List[int], recomb_rate: float, kappa_parameter: int, avoid_relatives: str=None, rng: np.random.Generator=None, mom_times: Dict[str, list]=None) -> Iterator[Generation]:
+    # The population of get_forward_population_gender_based_monoamorous_couples (the same one, with the same
+    # random state), yielded one generation at a time: generation i-1 is yielded once generation i, which
+    # gives its children, exists. Only the generations needed to form the next one are kept, so memory
+    # does not grow with num_gen. The partner search times are appended to the lists of mom_times as the
+    # generations are formed ('mom_time_list_per_gen', 'mom_time_list_per_gen_count', 'mom_time_all').
+    chrom_break_pos = get_chrom_break_pos(chrom_lengths)
+    if rng is None:
+        rng = np.random.default_rng(np.random.randint(0, 2**31 - 1))
+    if mom_times is None:
+        mom_times = {}
+    for key in ('mom_time_list_per_gen', 'mom_time_list_per_gen_count', 'mom_time_all'):
+        mom_times.setdefault(key, [])
+
+    prev_prev_gen = None
+    prev_gen = Generation(pop_size)
+    prev_gen.location = LocationAllocator().draw_uniform_on_circle(pop_size)  # Assign location uniformly
+    for i in range(1, num_gen):
+        gen, mom_time_list_curr_gen = get_next_couples_generation(i, pop_size, prev_gen, prev_prev_gen, chrom_break_pos, recomb_rate, kappa_parameter, avoid_relatives, rng)
+        mom_times['mom_time_all'].extend(mom_time_list_curr_gen)
+        mom_times['mom_time_list_per_gen'].append(np.average(mom_time_list_curr_gen))
+        mom_times['mom_time_list_per_gen_count'].append(len(mom_time_list_curr_gen))
+        yield prev_gen
+        prev_prev_gen, prev_gen = prev_gen, gen
+    yield prev_gen
+
+
+def get_forward_population_gender_based_monoamorous_couples(pop_size: int, num_gen: int, chrom_lengths: List[int], recomb_rate: float, kappa_parameter: int, avoid_relatives: str=None, rng: np.random.Generator=None, checkpoint_path: str=None, checkpoint_every: int=0, resume: bool=False) -> List[Generation]:
+    # With checkpoint_path (a directory) and checkpoint_every, the generations simulated so far, the random states and the
+    # partner search times are saved every checkpoint_every generations; with resume, the simulation continues
+    # from that checkpoint (if there is one) and gives the same population as an uninterrupted run.
     chrom_break_pos = get_chrom_break_pos(chrom_lengths)
+    if rng is None:
+        # Seeded from the global NumPy state, so the seed set in forward.py also fixes the recombinations
+        rng = np.random.default_rng(np.random.randint(0, 2**31 - 1))
     mu = 0  # mean direction (in radians)
     kappa = 2  # concentration parameter
     # High kappa (Large Concentration):
@@ -69,52 +135,33 @@ def get_forward_population_gender_based_monoamorous_couples(pop_size: int, num_g
     mom_time_list_per_gen_count=[]
     mom_time_all=[]
  
-    print('[DEBUG] : GEN 0')
-
-    for j in range(pop_size):
-        print(f'[DEBUG] : ind == {j}')
-        ind = Individual()
-        ind.location = np.random.uniform(0, 2 * np.pi)  # Assign location uniformly
-        pop[0].append(ind)
-
-    mom_time_list_curr_gen=[]
-    print(f'[DEBUG] : GEN 1')
-    for j in range(pop_size):
-        print(f'[DEBUG] : ind == {j}')
-        ind = Individual()
-        pop[1].append(ind)
-        mom_id, dad_id , mom_time= pop[1][j].set_parents_straight_monoamorous_couple(pop_size, pop[0],None, kappa_parameter,avoid_relatives)
-        if mom_time > -1 :
-            mom_time_list_curr_gen.append(mom_time)
-            mom_time_all.append(mom_time)
-        pop[1][j].location = Individual.uniform_location_on_circle(pop[0][mom_id],pop[0][dad_id],pop[1])
-        pop[1][j].set_break_pos(chrom_break_pos, recomb_rate)
-        pop[0][mom_id].children.append(j)
-        pop[0][dad_id].children.append(j)
-
-    mom_time_list_per_gen.append(np.average(mom_time_list_curr_gen))
-    mom_time_list_per_gen_count.append(len(mom_time_list_curr_gen))
-    for i in range(2, num_gen):
-        print(f'[DEBUG] : GEN {i}')
-
-        mom_time_list_curr_gen=[]
-        for j in range(pop_size):
-            print(f'[DEBUG] : ind == {j}')
-
-
-            ind = Individual()
-            pop[i].append(ind)
-            mom_id, dad_id , mom_time = pop[i][j].set_parents_straight_monoamorous_couple(pop_size, pop[i-1],pop[i-2], kappa_parameter,avoid_relatives)
-            if mom_time > -1 :
-                mom_time_list_curr_gen.append(mom_time)
-                mom_time_all.append(mom_time)
-            pop[i][j].location = Individual.uniform_location_on_circle(pop[i - 1][mom_id],pop[i - 1][dad_id],pop[i])
-            pop[i][j].set_break_pos(chrom_break_pos, recomb_rate)
-            pop[i - 1][mom_id].children.append(j)
-            pop[i - 1][dad_id].children.append(j)
+    first_gen = 1
+    checkpoint = PedigreeCheckpoint(checkpoint_path) if checkpoint_path else None
+    if resume and checkpoint is not None and checkpoint.exists():
+        saved_pop, meta = checkpoint.load()
+        if meta['parameters'] != [pop_size, num_gen, chrom_lengths, recomb_rate, kappa_parameter, avoid_relatives]:
+            raise ValueError(f"The checkpoint {checkpoint_path} belongs to a simulation with other parameters: {meta['parameters']}")
+        first_gen = len(saved_pop)
+        pop[:first_gen] = saved_pop
+        set_random_state(meta['random_state'], rng)
+        mom_time_list_per_gen, mom_time_list_per_gen_count, mom_time_all = meta['mom_time_list_per_gen'], meta['mom_time_list_per_gen_count'], meta['mom_time_all']
+    else:
+        pop[0] = Generation(pop_size)
+        pop[0].location = LocationAllocator().draw_uniform_on_circle(pop_size)  # Assign location uniformly
+
+    for i in range(first_gen, num_gen):
+        pop[i], mom_time_list_curr_gen = get_next_couples_generation(i, pop_size, pop[i - 1], pop[i - 2] if i >= 2 else None, chrom_break_pos, recomb_rate, kappa_parameter, avoid_relatives, rng)
+        mom_time_all.extend(mom_time_list_curr_gen)
         mom_time_list_per_gen.append(np.average(mom_time_list_curr_gen))
         mom_time_list_per_gen_count.append(len(mom_time_list_curr_gen))
 
+        if checkpoint is not None and checkpoint_every > 0 and (i % checkpoint_every == 0 or i == num_gen - 1):
+            meta = {'parameters': [pop_size, num_gen, chrom_lengths, recomb_rate, kappa_parameter, avoid_relatives],
+                    'random_state': get_random_state(rng), 'mom_time_list_per_gen': mom_time_list_per_gen,
+                    'mom_time_list_per_gen_count': mom_time_list_per_gen_count, 'mom_time_all': mom_time_all}
+            with timer('checkpoint', i):
+                checkpoint.save(pop[:i + 1], meta)
+
     return pop, mom_time_list_per_gen, mom_time_list_per_gen_count, np.average(mom_time_all)
 
 
@@ -0,0 +1,34 @@
+from typing import List, Tuple
+import numpy as np
+
+
+def draw_generation_break_pos(rng: np.random.Generator, pop_size: int, chrom_break_pos: List[int], recomb_rate: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # Break positions of all 2 * pop_size meioses of one generation, drawn with a single Generator.
+    # Each meiosis follows Individual.set_break_pos: every chromosome start is kept with
+    # probability 1/2 (independent assortment), a binomial number of recombination positions
+    # is drawn uniformly in [1, seq_len - 2], the list is sorted and seq_len is appended.
+    # Returns CSR-style (mom offsets, mom break positions, dad offsets, dad break positions).
+    seq_len = chrom_break_pos[-1]
+    chrom_starts = np.asarray(chrom_break_pos[:-1], dtype=np.int64)
+    num_meioses = 2 * pop_size
+
+    assortment = rng.integers(0, 2, size=(num_meioses, len(chrom_starts))) == 1
+    num_recomb = rng.binomial(seq_len, recomb_rate, size=num_meioses)
+    recomb_pos = rng.integers(1, seq_len - 1, size=int(num_recomb.sum()), dtype=np.int64)
+
+    meiosis_ids = np.arange(num_meioses, dtype=np.int64)
+    assorted_meioses, assorted_chroms = np.nonzero(assortment)
+    owners = np.concatenate((assorted_meioses, np.repeat(meiosis_ids, num_recomb), meiosis_ids))
+    positions = np.concatenate((chrom_starts[assorted_chroms], recomb_pos, np.full(num_meioses, seq_len, dtype=np.int64)))
+
+    # Sort by meiosis, then by position
+    order = np.lexsort((positions, owners))
+    positions = positions[order]
+    offsets = np.zeros(num_meioses + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(owners, minlength=num_meioses))
+
+    # The first pop_size meioses are the mothers', the last pop_size the fathers'
+    split = offsets[pop_size]
+    mom_offsets, mom_break_pos = offsets[:pop_size + 1], positions[:split]
+    dad_offsets, dad_break_pos = offsets[pop_size:] - split, positions[split:]
+    return mom_offsets, mom_break_pos, dad_offsets, dad_break_pos
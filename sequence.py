@@ -1,31 +1,76 @@
-from typing import List
+from typing import Tuple
+import numpy as np
 
 class Sequence:
-    def __init__(self) -> None:
-        self.ids: List[int] = []
-        self.lengths: List[int] = []
+    # A haplotype as run of segments: segment i carries ancestor ids[i] and covers
+    # [ends[i - 1], ends[i]) (with ends[-1] of the previous segment taken as 0 for i == 0).
+    # Segments are kept canonical: adjacent pieces with the same id are merged on insertion,
+    # except across the positions in `boundaries` (the chromosome starts), so that a segment
+    # never spans two chromosomes. num_merges counts the merges done while building the sequence.
+    def __init__(self, ids: np.ndarray = None, ends: np.ndarray = None, boundaries: np.ndarray = None) -> None:
+        self.ids: np.ndarray = np.empty(0, dtype=np.int64) if ids is None else ids
+        self.ends: np.ndarray = np.empty(0, dtype=np.int64) if ends is None else ends
+        self.boundaries: np.ndarray = np.empty(0, dtype=np.int64) if boundaries is None else boundaries
+        self.num_merges: int = 0
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.ends, prepend=0)
+
+    @property
+    def seq_len(self) -> int:
+        return int(self.ends[-1]) if len(self.ends) > 0 else 0
+
+    def is_boundary(self, pos: np.ndarray) -> np.ndarray:
+        if len(self.boundaries) == 0:
+            return np.zeros(np.shape(pos), dtype=bool)
+        index = np.searchsorted(self.boundaries, pos)
+        return (index < len(self.boundaries)) & (self.boundaries[np.minimum(index, len(self.boundaries) - 1)] == pos)
+
+    def can_merge(self, id: int) -> bool:
+        # Whether a piece with this id starting at seq_len continues the last segment
+        return len(self.ids) > 0 and self.ids[-1] == id and not self.is_boundary(self.seq_len)
 
     def add_segment(self, id: int, length: int) -> None:
         if length > 0:
-            self.ids.append(id)
-            self.lengths.append(length)
+            if self.can_merge(id):
+                self.ends = np.append(self.ends[:-1], np.int64(self.seq_len + length))
+                self.num_merges += 1
+            else:
+                self.ids = np.append(self.ids, np.int64(id))
+                self.ends = np.append(self.ends, np.int64(self.seq_len + length))
 
     def extend(self, other: 'Sequence') -> None:
-        self.ids.extend(other.ids)
-        self.lengths.extend(other.lengths)
+        ends = other.ends + self.seq_len
+        if len(other.ids) > 0 and self.can_merge(other.ids[0]):
+            # The first piece of other continues our last segment
+            self.ids = np.concatenate((self.ids, other.ids[1:]))
+            self.ends = np.concatenate((self.ends[:-1], ends))
+            self.num_merges += 1
+        else:
+            self.ids = np.concatenate((self.ids, other.ids))
+            self.ends = np.concatenate((self.ends, ends))
+
+    def coalesce(self) -> None:
+        # Merge all adjacent segments with the same id (not across boundaries) in one pass
+        merge = (self.ids[1:] == self.ids[:-1]) & ~self.is_boundary(self.ends[:-1])
+        if merge.any():
+            keep = np.append(~merge, True)
+            self.ids = self.ids[keep]
+            self.ends = self.ends[keep]
+            self.num_merges += int(merge.sum())
+
+    def get_segment_range(self, start_pos: np.ndarray, end_pos: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Index of the first and the last segment overlapping each [start_pos, end_pos)
+        first = np.searchsorted(self.ends, start_pos, side='right')
+        last = np.searchsorted(self.ends, end_pos, side='left')
+        return first, last
 
     def get_sequence(self, start_pos: int, end_pos: int) -> 'Sequence':
-        i = 0
-        pointer = 0
-        out_seq = Sequence()
-        while True:
-            pointer += self.lengths[i]
-            if start_pos >= pointer:
-                i += 1
-            elif end_pos > pointer:
-                out_seq.add_segment(self.ids[i], pointer - start_pos)
-                i += 1
-                start_pos = pointer
-            else:
-                out_seq.add_segment(self.ids[i], end_pos - start_pos)
-                return out_seq
+        # The piece [start_pos, end_pos), with positions (and boundaries) relative to start_pos
+        if end_pos <= start_pos:
+            return Sequence(boundaries=self.boundaries - start_pos)
+        first, last = self.get_segment_range(start_pos, end_pos)
+        ends = self.ends[first:last + 1] - start_pos
+        ends[-1] = end_pos - start_pos
+        return Sequence(self.ids[first:last + 1].copy(), ends, self.boundaries - start_pos)
@@ -0,0 +1,129 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import sys
+import time
+from typing import List
+from auxiliary_functions import get_pool_context
+from forward import get_parser, check_args, run
+
+# Runs forward.py simulations over a parameter grid and a list of seeds in one process (or one pool
+# of processes), instead of one job per replicate. The replicates can also be split among the
+# tasks of a SLURM array: task i runs replicates i, i + n, i + 2n, ... of the n tasks.
+# All results go to one columnar JSON file: one list per result key, one entry per replicate.
+#
+# Examples:
+#   python sweep.py -p 100 200 -k 1e-8 1 --seeds 1 2 3 --processes 4 --out_file sweep.json -- -g 50 -f chrom_length.txt
+#   python sweep.py ... --out_file sweep.json (in a SLURM array job, writes sweep_task<i>.json)
+#   python sweep.py --merge sweep_task*.json --out_file sweep.json
+
+
+def get_replicate_args(sweep_args: argparse.Namespace, forward_args: List[str]) -> List[List[str]]:
+    # Command line of every replicate: the common forward.py options, then the grid values and the seed
+    # (a grid axis that is not given keeps the forward.py value)
+    axes = [('-p', sweep_args.pop_size), ('-g', sweep_args.num_gen), ('-k', sweep_args.kappa_parameter), ('-a', sweep_args.avoid_relatives), ('-s', sweep_args.seeds)]
+    axes = [(option, values) for option, values in axes if values is not None]
+    replicates = []
+    for point in itertools.product(*[values for _, values in axes]):
+        argv = list(forward_args)
+        for (option, _), value in zip(axes, point):
+            argv += [option, '' if option == '-a' and value == 'none' else str(value)]
+        replicates.append(argv)
+    return replicates
+
+
+def run_replicate(argv: List[str]) -> dict:
+    parser = get_parser()
+    args = parser.parse_args(argv)
+    check_args(parser, args)
+    start_time = time.perf_counter()
+    try:
+        # Progress output of the simulation goes to stderr, like the rest of its logging
+        with contextlib.redirect_stdout(sys.stderr):
+            data = run(args)
+    except ValueError as e:
+        # e.g. no couples could be formed with these parameters
+        data = {'pop_size': args.pop_size, 'num_gen': args.num_gen, 'seed': args.seed,
+                'kappa_parameter': args.kappa_parameter, 'avoid_relatives': args.avoid_relatives, 'error': str(e)}
+    data['runtime_replicate'] = time.perf_counter() - start_time
+    return data
+
+
+def to_columns(results: List[dict]) -> dict:
+    # One list per key, with None where a replicate has no value
+    keys = sorted(set(key for data in results for key in data))
+    return {key: [data.get(key) for data in results] for key in keys}
+
+
+def merge_columns(parts: List[dict]) -> dict:
+    num_rows = [len(next(iter(part.values()))) if part else 0 for part in parts]
+    keys = sorted(set(key for part in parts for key in part))
+    return {key: [value for part, n in zip(parts, num_rows) for value in part.get(key, [None] * n)] for key in keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parameter sweep of forward.py simulations. Options after -- are passed to every forward.py run')
+    parser.add_argument('-p', '--pop_size', type=int, nargs='+', default=None, help='Population sizes')
+    parser.add_argument('-g', '--num_gen', type=int, nargs='+', default=None, help='Numbers of generations')
+    parser.add_argument('-k', '--kappa_parameter', type=float, nargs='+', default=None, help='Kappa parameters')
+    parser.add_argument('-a', '--avoid_relatives', type=str, nargs='+', default=None, help='Inbreeding avoidance settings ("none", "siblings", "cousins", "siblingscousins")')
+    parser.add_argument('-s', '--seeds', type=int, nargs='+', default=[1], help='Seeds of the replicates of every grid point (0 is not allowed)')
+    parser.add_argument('--processes', type=int, default=1, help='Number of replicates run in parallel')
+    parser.add_argument('--task_index', type=int, default=None, help='Index of this task among --num_tasks (default: $SLURM_ARRAY_TASK_ID)')
+    parser.add_argument('--num_tasks', type=int, default=None, help='Number of tasks sharing the replicates (default: $SLURM_ARRAY_TASK_COUNT)')
+    parser.add_argument('--out_file', type=str, default='sweep_results.json', help='Columnar JSON results file')
+    parser.add_argument('--merge', type=str, nargs='+', default=None, help='Merge these task result files into --out_file instead of running')
+    sweep_args, forward_args = parser.parse_known_args()
+    if forward_args and forward_args[0] == '--':
+        forward_args = forward_args[1:]
+
+    if sweep_args.merge:
+        parts = []
+        for file_path in sweep_args.merge:
+            with open(file_path, 'r') as json_file:
+                parts.append(json.load(json_file))
+        with open(sweep_args.out_file, 'w') as json_file:
+            json.dump(merge_columns(parts), json_file, indent=4, sort_keys=True)
+        return
+
+    if 0 in sweep_args.seeds:
+        parser.error('seed 0 (unseeded) would make the replicates run in a pool share their random state')
+    task_index = sweep_args.task_index if sweep_args.task_index is not None else os.getenv('SLURM_ARRAY_TASK_ID')
+    num_tasks = sweep_args.num_tasks if sweep_args.num_tasks is not None else os.getenv('SLURM_ARRAY_TASK_COUNT')
+    if (task_index is None) != (num_tasks is None):
+        parser.error('--task_index and --num_tasks must be given together')
+
+    replicates = get_replicate_args(sweep_args, forward_args)
+    out_file = sweep_args.out_file
+    if task_index is not None:
+        task_index, num_tasks = int(task_index), int(num_tasks)
+        replicates = replicates[task_index::num_tasks]
+        root, ext = os.path.splitext(out_file)
+        out_file = f'{root}_task{task_index}{ext}'
+
+    # Check every command line before starting
+    for argv in replicates:
+        forward_parser = get_parser()
+        forward = forward_parser.parse_args(argv)
+        check_args(forward_parser, forward)
+        if sweep_args.processes > 1 and (forward.workers > 1 or forward.chrom_workers > 0):
+            parser.error('--workers and --chrom_workers cannot be used with --processes > 1')
+
+    print(f'Running {len(replicates)} replicates', file=sys.stderr)
+    start_time = time.perf_counter()
+    if sweep_args.processes > 1:
+        # A fresh process per replicate, so no state is carried from one replicate to the next
+        with get_pool_context().Pool(sweep_args.processes, maxtasksperchild=1) as pool:
+            results = pool.map(run_replicate, replicates, chunksize=1)
+    else:
+        results = [run_replicate(argv) for argv in replicates]
+    print(f'Finished {len(replicates)} replicates in {str(round(time.perf_counter() - start_time, 2))} seconds', file=sys.stderr)
+
+    with open(out_file, 'w') as json_file:
+        json.dump(to_columns(results), json_file, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+from typing import Iterable, List, Tuple
+import copy
+import functools
+import os
+import numpy as np
+from chrom_pair import ChromPair, get_total_ibd_length
+from generation import as_generation
+from ibd_matrix import write_ibd_matrix
+from parallel_ibd import ParallelIbd
+from bitset import num_words, column_popcount
+from instrumentation import timer, count, is_enabled
+from individual import Individual
+from auxiliary_functions import sum_list_of_int, mean_list_of_int, mean_non_zero
+
+
+class GenerationCollector:
+    # A per-generation statistic computed from the transmitted genomes.
+    # transmit_genome calls start() with the founders (generation 0) and update() with every
+    # following generation as soon as its genomes are produced; get_result() returns the statistic.
+    def start(self, founders: List[ChromPair]) -> None:
+        pass
+
+    def update(self, gen_index: int, curr_gen: List[ChromPair]) -> None:
+        pass
+
+    def finish(self) -> None:
+        # Called once after the last generation (also when the transmission fails) to release resources
+        pass
+
+    def get_result(self):
+        raise NotImplementedError
+
+
+class ReducibleCollector(GenerationCollector):
+    # A statistic built from one partial value per generation that can also be measured on disjoint
+    # parts of the genome (e.g. one chromosome each) and combined: measure() gives the partial of a
+    # generation, combine() merges the partials of two parts, summarize() turns the partial of a
+    # generation into its summary and collect() the summaries of all generations into the statistic.
+    # new_part() returns an empty collector with the same settings, for measuring one part.
+    # Only the summaries are kept, unless keep_partials is set (as it is for the parts, whose partials
+    # are combined afterwards), so the memory used does not grow with the partials' size.
+    keep_partials = False
+
+    def start(self, founders: List[ChromPair]) -> None:
+        self.partials = []
+        self.summaries = []
+        self.update(0, founders)
+
+    def update(self, gen_index: int, curr_gen: List[ChromPair]) -> None:
+        partial = self.measure(gen_index, curr_gen)
+        if self.keep_partials:
+            self.partials.append(partial)
+        self.summaries.append(self.summarize(gen_index, partial))
+
+    def reduce(self, part_partials: List[list]) -> None:
+        # Partials of the whole genome from the partials of every part
+        self.partials = [functools.reduce(self.combine, gen_partials) for gen_partials in zip(*part_partials)]
+        self.summaries = [self.summarize(i, partial) for i, partial in enumerate(self.partials)]
+
+    def new_part(self) -> "ReducibleCollector":
+        part = copy.copy(self)
+        part.keep_partials = True
+        return part
+
+    def measure(self, gen_index: int, curr_gen: List[ChromPair]):
+        raise NotImplementedError
+
+    def combine(self, a, b):
+        raise NotImplementedError
+
+    def summarize(self, gen_index: int, partial):
+        raise NotImplementedError
+
+    def collect(self, summaries: list):
+        # One list per summary value, by default
+        return tuple(list(values) for values in zip(*summaries))
+
+    def get_result(self):
+        return self.collect(self.summaries)
+
+
+# Unique founder ids carried by every individual, as one array per individual
+def get_founder_sets(curr_gen: List[ChromPair]) -> List[np.ndarray]:
+    return [np.unique(np.concatenate((ind.chrom_pair[0].ids, ind.chrom_pair[1].ids))) for ind in curr_gen]
+
+
+class DescendantCollector(ReducibleCollector):
+    # Mean number of genetic descendants of the founders that still have some.
+    # The partial of a generation is the founder set of every individual, packed as bitset rows.
+    def start(self, founders: List[ChromPair]) -> None:
+        self.num_founders = len(founders)
+        super().start(founders)
+
+    def measure(self, gen_index: int, curr_gen: List[ChromPair]) -> np.ndarray:
+        founder_sets = get_founder_sets(curr_gen)
+        rows = np.repeat(np.arange(len(curr_gen)), [len(founders) for founders in founder_sets])
+        founders = np.concatenate(founder_sets)
+        bits = np.zeros((len(curr_gen), num_words(self.num_founders)), dtype=np.uint64)
+        np.bitwise_or.at(bits, (rows, founders // 64), np.left_shift(np.uint64(1), (founders % 64).astype(np.uint64)))
+        return bits
+
+    def combine(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        return a | b
+
+    def summarize(self, gen_index: int, bits: np.ndarray) -> float:
+        if gen_index == 0:
+            return 1
+        # Columns past the last founder are always 0 and are ignored by mean_non_zero
+        num_descendants = column_popcount(bits, 64 * bits.shape[1])
+        return mean_non_zero(num_descendants.tolist())
+
+    def collect(self, summaries: List[float]) -> List[float]:
+        return list(summaries)
+
+
+class SegmentCollector(ReducibleCollector):
+    # Mean segment count per individual (both copies) and mean segment length.
+    # The partial of a generation is (number of segments, sequence length, population size).
+    def measure(self, gen_index: int, curr_gen: List[ChromPair]) -> Tuple[int, int, int]:
+        num_segments = sum_list_of_int([len(ind.chrom_pair[0].ids) + len(ind.chrom_pair[1].ids) for ind in curr_gen])
+        return num_segments, curr_gen[0].chrom_pair[0].seq_len, len(curr_gen)
+
+    def combine(self, a: Tuple[int, int, int], b: Tuple[int, int, int]) -> Tuple[int, int, int]:
+        return a[0] + b[0], a[1] + b[1], a[2]
+
+    def summarize(self, gen_index: int, partial: Tuple[int, int, int]) -> Tuple[float, int]:
+        num_segments, seq_len, pop_size = partial
+        return float(num_segments) / float(pop_size), 2 * seq_len * pop_size // num_segments
+
+
+class RohCollector(ReducibleCollector):
+    # ROH frequency and mean ROH length, and with roh_bins the mean number of ROH per length class.
+    # The partial of a generation is (sequence length, ROH length and count of every individual,
+    # summed ROH length histogram); runs of homozygosity never span two chromosomes.
+    def __init__(self, roh_bins: List[int] = None) -> None:
+        self.roh_bins = roh_bins
+
+    def measure(self, gen_index: int, curr_gen: List[ChromPair]):
+        pop_size = len(curr_gen)
+        seq_len = curr_gen[0].chrom_pair[0].seq_len
+        roh_lengths = np.zeros(pop_size, dtype=np.int64)
+        roh_counts = np.zeros(pop_size, dtype=np.int64)
+        roh_hist_sum = None if self.roh_bins is None else np.zeros(len(self.roh_bins) - 1, dtype=np.int64)
+        if gen_index == 0:
+            # Not reported for the founders
+            return seq_len, roh_lengths, roh_counts, roh_hist_sum
+        for j in range(pop_size):
+            if self.roh_bins is None:
+                roh_lengths[j], roh_counts[j] = curr_gen[j].get_roh(seq_len)
+            else:
+                roh_lengths[j], roh_counts[j], hist = curr_gen[j].get_roh(seq_len, self.roh_bins)
+                roh_hist_sum += hist
+        return seq_len, roh_lengths, roh_counts, roh_hist_sum
+
+    def combine(self, a, b):
+        return a[0] + b[0], a[1] + b[1], a[2] + b[2], None if a[3] is None else a[3] + b[3]
+
+    def summarize(self, gen_index: int, partial) -> tuple:
+        # (ROH frequency, mean ROH length) and with roh_bins the mean ROH length histogram
+        if gen_index == 0:
+            if self.roh_bins is not None:
+                return 0, 0, [float(0.0) for k in range(len(self.roh_bins) - 1)]
+            return 0, 0
+        seq_len, roh_lengths, roh_counts, roh_hist_sum = partial
+        roh_lengths = roh_lengths.tolist()
+        roh_freq = float(mean_list_of_int(roh_lengths)) / float(seq_len)
+        s = sum_list_of_int(roh_counts.tolist())
+        mean_roh_len = sum_list_of_int(roh_lengths) // s if s > 0 else 0
+        if self.roh_bins is not None:
+            return roh_freq, mean_roh_len, (roh_hist_sum / len(roh_lengths)).tolist()
+        return roh_freq, mean_roh_len
+
+
+IBD_METHODS = ('pairwise', 'aggregate')
+
+
+class IbdCollector(ReducibleCollector):
+    # Mean pairwise IBD proportion over all pairs of individuals.
+    # method 'pairwise' compares every pair with ChromPair.get_ibd_length, 'aggregate' gets the same
+    # total from per-id haplotype counts (get_total_ibd_length) without visiting the pairs.
+    # With workers > 1 the pairwise comparisons are split among a pool of processes (parallel_ibd.py).
+    # The partial of a generation is (total IBD length, population size, sequence length).
+    def __init__(self, method: str = 'pairwise', workers: int = 1, verbose: bool = True) -> None:
+        if method not in IBD_METHODS:
+            raise ValueError(f"Unknown IBD method '{method}'. Possible values: {', '.join(IBD_METHODS)}")
+        self.method = method
+        self.workers = workers
+        self.verbose = verbose
+        self.parallel_ibd = None
+
+    def new_part(self) -> "IbdCollector":
+        # Parts are measured inside worker processes, one process each
+        part = IbdCollector(self.method, 1, False)
+        part.keep_partials = True
+        return part
+
+    def start(self, founders: List[ChromPair]) -> None:
+        if self.method == 'pairwise' and self.workers > 1:
+            self.parallel_ibd = ParallelIbd(self.workers)
+        super().start(founders)
+
+    def finish(self) -> None:
+        if self.parallel_ibd is not None:
+            self.parallel_ibd.close()
+            self.parallel_ibd = None
+
+    def measure(self, gen_index: int, curr_gen: List[ChromPair]) -> Tuple[int, int, int]:
+        pop_size = len(curr_gen)
+        seq_len = curr_gen[0].chrom_pair[0].seq_len
+        total_ibd_length = 0
+        if gen_index == 0:
+            # Not reported for the founders
+            return total_ibd_length, pop_size, seq_len
+
+        # Compute IBD across all individuals in the generation
+        if self.method == 'aggregate':
+            total_ibd_length = get_total_ibd_length(curr_gen)
+        elif self.parallel_ibd is not None:
+            total_ibd_length = self.parallel_ibd.get_total_ibd_length(curr_gen)
+        else:
+            for j in range(pop_size):
+                for k in range(j + 1, pop_size):  # Avoid duplicate comparisons
+                    total_ibd_length += curr_gen[j].get_ibd_length(curr_gen[k])
+
+        if self.verbose:
+            self.report(gen_index, (total_ibd_length, pop_size, seq_len))
+        return total_ibd_length, pop_size, seq_len
+
+    def report(self, gen_index: int, partial: Tuple[int, int, int]) -> None:
+        total_ibd_length, pop_size, seq_len = partial
+        print(f"\n--- Generation {gen_index} ---")
+        print(f"Total IBD Length: {total_ibd_length}")
+        print(f"Population Size: {pop_size}")
+        print(f"Sequence Length: {seq_len}")
+        print(f"Denominator (pop_size * seq_len): {(pop_size * (pop_size - 1) // 2) * seq_len}")
+
+    def reduce(self, part_partials: List[list]) -> None:
+        super().reduce(part_partials)
+        if self.verbose:
+            for i in range(1, len(self.partials)):
+                self.report(i, self.partials[i])
+
+    def combine(self, a: Tuple[int, int, int], b: Tuple[int, int, int]) -> Tuple[int, int, int]:
+        return a[0] + b[0], a[1], a[2] + b[2]
+
+    def summarize(self, gen_index: int, partial: Tuple[int, int, int]) -> float:
+        if gen_index == 0:
+            return 0.0
+        total_ibd_length, pop_size, seq_len = partial
+        return total_ibd_length / ((pop_size * (pop_size - 1) // 2) * seq_len)
+
+    def collect(self, summaries: List[float]) -> List[float]:
+        return list(summaries)
+
+
+class SampledIbdCollector(GenerationCollector):
+    # Estimate of the mean pairwise IBD proportion from num_pairs random pairs of individuals,
+    # with its standard error. The same pairs (by index) are used in every generation of the
+    # same size, so the generations are compared on the same sample. The pairs are drawn from a
+    # Generator of their own (seeded with seed), not from the random states of the simulation, so that
+    # a streamed run (forward.py --stream) simulates the same pedigree as an in-memory one.
+    def __init__(self, num_pairs: int = 1000, seed: int = None) -> None:
+        if num_pairs < 2:
+            raise ValueError(f"At least 2 pairs are needed to estimate the IBD proportion, got {num_pairs}")
+        self.num_pairs = num_pairs
+        self.rng = np.random.default_rng(seed)
+
+    def draw_pairs(self, pop_size: int) -> None:
+        # Pairs of distinct individuals, drawn with replacement
+        first = self.rng.integers(0, pop_size, size=self.num_pairs)
+        second = self.rng.integers(0, pop_size - 1, size=self.num_pairs)
+        second += second >= first
+        self.pairs = np.stack((np.minimum(first, second), np.maximum(first, second)), axis=1).tolist()
+        self.pairs_pop_size = pop_size
+
+    def start(self, founders: List[ChromPair]) -> None:
+        self.seq_len = founders[0].chrom_pair[0].seq_len
+        self.ibd_proportions = [0.0]
+        self.standard_errors = [0.0]
+        self.draw_pairs(len(founders))
+
+    def update(self, gen_index: int, curr_gen: List[ChromPair]) -> None:
+        if len(curr_gen) != self.pairs_pop_size:
+            self.draw_pairs(len(curr_gen))
+        ibd_lengths = np.array([curr_gen[j].get_ibd_length(curr_gen[k]) for j, k in self.pairs], dtype=np.float64)
+        proportions = ibd_lengths / self.seq_len
+        self.ibd_proportions.append(float(proportions.mean()))
+        self.standard_errors.append(float(proportions.std(ddof=1) / np.sqrt(self.num_pairs)))
+
+        print(f"\n--- Generation {gen_index} ---")
+        print(f"Sampled pairs: {self.num_pairs}")
+        print(f"IBD proportion estimate: {self.ibd_proportions[-1]} (standard error {self.standard_errors[-1]})")
+
+    def get_result(self) -> Tuple[List[float], List[float]]:
+        return self.ibd_proportions, self.standard_errors
+
+
+class IbdMatrixCollector(GenerationCollector):
+    # Writes the N x N IBD length matrix and the long shared segments of the selected generations
+    # to out_dir/gen_i (see ibd_matrix.write_ibd_matrix); get_result returns the directories written.
+    def __init__(self, generations: List[int], out_dir: str, min_segment_len: int, block_size: int = 256) -> None:
+        self.generations = set(generations)
+        self.out_dir = out_dir
+        self.min_segment_len = min_segment_len
+        self.block_size = block_size
+        self.gen_dirs = []
+
+    def start(self, founders: List[ChromPair]) -> None:
+        self.update(0, founders)
+
+    def update(self, gen_index: int, curr_gen: List[ChromPair]) -> None:
+        if gen_index in self.generations:
+            gen_dir = os.path.join(self.out_dir, f'gen_{gen_index}')
+            write_ibd_matrix(curr_gen, gen_dir, self.min_segment_len, self.block_size, gen_index)
+            self.gen_dirs.append(gen_dir)
+
+    def get_result(self) -> List[str]:
+        return self.gen_dirs
+
+
+def get_next_generation(gen, prev_gen: List[ChromPair]) -> List[ChromPair]:
+    # Genomes of one generation from the genomes of its parents and its break positions
+    gen = as_generation(gen)
+    curr_gen = [ChromPair() for j in range(len(gen))]
+    for j in range(len(gen)):
+        mom_break_pos = gen.mom_break_pos[gen.mom_break_offsets[j]:gen.mom_break_offsets[j + 1]]
+        dad_break_pos = gen.dad_break_pos[gen.dad_break_offsets[j]:gen.dad_break_offsets[j + 1]]
+        curr_gen[j].chrom_pair[0] = prev_gen[gen.mom_id[j]].get_chrom(mom_break_pos)
+        curr_gen[j].chrom_pair[1] = prev_gen[gen.dad_id[j]].get_chrom(dad_break_pos)
+    return curr_gen
+
+
+def transmit_genome(pop: Iterable[List[Individual]], chrom_lengths: List[int], collectors: List[GenerationCollector]) -> None:
+    # Walks the pedigree forward once: founders get their own id on every chromosome and every
+    # generation inherits its genome through the recorded break positions. Each collector sees
+    # every generation as it is produced, so several statistics share a single transmission.
+    # pop is only iterated once, so it can also be a stream of generations (e.g. from
+    # population.iterate_forward_population_gender_based_monoamorous_couples): then only the
+    # current generation of the pedigree and of the genomes is held in memory.
+    try:
+        for i, gen in enumerate(pop):
+            if i == 0:
+                prev_gen = [ChromPair.get_founder(j, chrom_lengths) for j in range(len(gen))]
+                for collector in collectors:
+                    collector.start(prev_gen)
+                continue
+            with timer('transmission', i):
+                curr_gen = get_next_generation(gen, prev_gen)
+            if is_enabled('generation'):
+                count('segment_merges', sum_list_of_int([ind.chrom_pair[0].num_merges + ind.chrom_pair[1].num_merges for ind in curr_gen]), i)
+            for collector in collectors:
+                with timer(type(collector).__name__, i):
+                    collector.update(i, curr_gen)
+            prev_gen = curr_gen
+    finally:
+        for collector in collectors:
+            collector.finish()